@@ -0,0 +1,66 @@
+import threading
+
+from ChatGPT_Web.client_pool import client_registry
+
+
+class AssistantRegistry:
+    def __init__(self, name="code interpreter"):
+        """全域共用的AI助手註冊表，每個部署只建立一個 code interpreter 助手並讓所有使用者共用。
+
+        Args:
+            name (str): 助手的名稱，用來尋找先前已建立的助手。
+        """
+        self.name = name
+        self._assistants = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _key(self, config):
+        return (config["endpoint"], config["deployment"], config["key"])
+
+    def get(self, config):
+        """取得（或建立）指定部署的助手，第一次呼叫時才會連線建立。
+
+        Args:
+            config (dict): Assistants 配置中某個模型的子配置。
+
+        Returns:
+            tuple: 包含客戶端與助手的對象。
+        """
+        key = self._key(config)
+        assistant = self._assistants.get(key)
+        if assistant is None:
+            with self._lock:
+                lock = self._locks.setdefault(key, threading.Lock())
+            # 每個部署各自上鎖，避免同時建立多個重複的助手
+            with lock:
+                assistant = self._assistants.get(key)
+                if assistant is None:
+                    assistant = self._find_or_create(config)
+                    self._assistants[key] = assistant
+        return client_registry.get_for(config), assistant
+
+    def _find_or_create(self, config):
+        """優先重複使用伺服器上同名且同模型的助手，找不到時才建立新的助手。
+
+        Args:
+            config (dict): Assistants 配置中某個模型的子配置。
+
+        Returns:
+            Assistant: 助手對象。
+        """
+        client = client_registry.get_for(config)
+        try:
+            for assistant in client.beta.assistants.list(limit=100):
+                if assistant.name == self.name and assistant.model == config["deployment"]:
+                    return assistant
+        except Exception:
+            pass  # 無法列出時直接建立新的助手
+        return client.beta.assistants.create(  # 創建AI助手
+            name=self.name,
+            tools=[{"type": "code_interpreter"}],
+            model=config["deployment"]
+        )
+
+
+assistant_registry = AssistantRegistry()
@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from ChatGPT_Web.call_gpt import ChatGPT
+from ChatGPT_Web.streaming import run_sync
+
+
+def load_prompts(path):
+    """逐行讀取 JSONL 的提問，不會將整個檔案讀入記憶體。
+
+    每一行為 {"id": ..., "prompt": ...}，prompt 也可以寫成 text；沒有 id 時以行號代替。
+
+    Args:
+        path (str): 輸入檔案的路徑。
+
+    Yields:
+        tuple: (id, 提問)。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            prompt = item.get("prompt", item.get("text"))
+            if prompt is None:
+                raise ValueError(f"Line {number} of {path} has no \"prompt\" field.")
+            yield str(item.get("id", number)), prompt
+
+
+def completed_ids(path):
+    """讀取已完成的輸出，用於中斷後從上次的位置繼續。
+
+    中斷時寫到一半的最後一行與失敗的紀錄不算完成，會再執行一次。
+
+    Args:
+        path (str): 輸出檔案的路徑。
+
+    Returns:
+        set: 已成功完成的 id。
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if item.get("error") is None:
+                done.add(str(item["id"]))
+    return done
+
+
+def _open_output(path):
+    """以附加模式開啟輸出檔案，上次中斷留下不完整的一行時先補上換行。"""
+    needs_newline = False
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    f = open(path, 'a', encoding='utf-8')
+    if needs_newline:
+        f.write("\n")
+    return f
+
+
+def resolve_model(model_list, model):
+    """從 model_config.json 的內容找出模型配置。
+
+    Args:
+        model_list (list): model_config.json 的內容。
+        model (str): 模型名稱。
+
+    Returns:
+        dict: 模型配置。
+
+    Raises:
+        ValueError: 找不到模型或模型不支援批次處理。
+    """
+    for config in model_list:
+        if config["model_name"] == model:
+            # Vision 模型只處理附有圖片的提問
+            if model in ("Assistants", "Dall-E-3", "GPT-4 Vision"):
+                raise ValueError(f"{model} does not support batch mode.")
+            return config
+    raise ValueError(f"Model {model!r} was not found in the model config.")
+
+
+async def answer(config, system_message, prompt, max_tokens, user):
+    """以新的 ChatGPT 實例回答單一提問，提問之間不共用對話紀錄。
+
+    Args:
+        config (dict): 模型配置。
+        system_message (str): 系統訊息。
+        prompt (str): 提問。
+        max_tokens (int): 最大 token 數。
+        user (str): 傳給 Azure 的使用者身份標識。
+
+    Returns:
+        dict: 包含 response、finish_reason、usage 與 error 的結果。
+    """
+    chatgpt = ChatGPT(config, {"role": "system", "content": system_message})
+    parts = []
+    result = {"finish_reason": None, "usage": None, "error": None}
+    async for event in chatgpt.aget_response(prompt, max_tokens, user, delta=True):
+        if event.type == "delta":
+            parts.append(event.content)
+        elif event.type == "finish":
+            result["finish_reason"] = event.data.get("finish_reason")
+        elif event.type == "usage":
+            result["usage"] = event.data
+        elif event.type == "error":
+            result["error"] = event.content
+    result["response"] = "".join(parts)
+    if not result["response"] and result["error"] is None:
+        # 沒有內容的回答不算完成，繼續執行時會再試一次
+        result["error"] = f"No content was returned (finish_reason: {result['finish_reason']})."
+    return result
+
+
+async def arun_batch(input_path, output_path, model, system_message="default", username="nick", system_prompt=None,
+                     max_tokens=1000, concurrency=8, config_path='model_config.json', user_config_path='user_config.json',
+                     user="batch", progress=None):
+    """批次回答 JSONL 中的提問，每完成一筆就寫入輸出檔案，中斷後重新執行會略過已完成的提問。
+
+    請求會經過部署的TPM/RPM配額與回應快取，與網頁介面使用相同的配置。
+
+    Args:
+        input_path (str): 輸入的 JSONL 檔案。
+        output_path (str): 輸出的 JSONL 檔案，已存在時附加在後面。
+        model (str): model_config.json 中的模型名稱。
+        system_message (str): user_config.json 中該用戶的系統訊息名稱。
+        username (str): 讀取系統訊息的用戶名。
+        system_prompt (str, optional): 直接指定系統訊息的內容，優先於 system_message。
+        max_tokens (int): 每個回答的最大 token 數。
+        concurrency (int): 同時進行的請求數量。
+        config_path (str): 模型配置檔案的路徑。
+        user_config_path (str): 用戶配置檔案的路徑。
+        user (str): 傳給 Azure 的使用者身份標識。
+        progress (callable, optional): 每完成一筆時以統計結果呼叫。
+
+    Returns:
+        dict: 總數、略過、成功、失敗的筆數與花費的秒數。
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = resolve_model(json.load(f), model)
+    if system_prompt is None:
+        # 只讀取檔案，不經過 ConfigStore，避免結束時寫回而覆蓋網頁伺服器的修改
+        with open(user_config_path, 'r', encoding='utf-8') as f:
+            messages = json.load(f)[1].get(username, {})
+        if system_message not in messages:
+            raise ValueError(f"System message {system_message!r} was not found for user {username!r}.")
+        system_prompt = messages[system_message]
+
+    done = completed_ids(output_path)
+    stats = {"total": 0, "skipped": 0, "succeeded": 0, "failed": 0, "seconds": 0.0}
+    started = time.monotonic()
+    prompts = load_prompts(input_path)
+
+    async def worker(output):
+        # 由固定數量的工作依序取用提問，不會一次建立所有的 Task
+        for item_id, prompt in prompts:
+            stats["total"] += 1
+            if item_id in done:
+                stats["skipped"] += 1
+                continue
+            try:
+                result = await answer(config, system_prompt, prompt, max_tokens, user)
+            except Exception as e:
+                result = {"response": "", "finish_reason": None, "usage": None, "error": str(e)}
+            stats["failed" if result["error"] else "succeeded"] += 1
+            output.write(json.dumps({"id": item_id, **result}, ensure_ascii=False) + "\n")
+            output.flush()  # 每筆寫入後立即保存，作為中斷後繼續的檢查點
+            stats["seconds"] = time.monotonic() - started
+            if progress is not None:
+                progress(stats)
+
+    with _open_output(output_path) as output:
+        await asyncio.gather(*(worker(output) for _ in range(max(1, concurrency))))
+    stats["seconds"] = time.monotonic() - started
+    return stats
+
+
+def run_batch(input_path, output_path, model, **kwargs):
+    """arun_batch 的同步版本，參數相同。
+
+    Returns:
+        dict: 總數、略過、成功、失敗的筆數與花費的秒數。
+    """
+    return run_sync(arun_batch(input_path, output_path, model, **kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer JSONL prompts with a chat deployment, without the web server.")
+    parser.add_argument("input", help="JSONL file with one {\"id\": ..., \"prompt\": ...} object per line.")
+    parser.add_argument("output", help="JSONL file for the results. Completed ids are skipped when resuming.")
+    parser.add_argument("--model", default="GPT-3.5 Turbo", help="Model name in the model config.")
+    parser.add_argument("--system-message", default="default", help="System message name in the user config.")
+    parser.add_argument("--username", default="nick", help="User whose system messages are used.")
+    parser.add_argument("--system-prompt", help="Use this system message text instead of a named one.")
+    parser.add_argument("--max-tokens", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--config", default="model_config.json")
+    parser.add_argument("--user-config", default="user_config.json")
+    args = parser.parse_args()
+
+    def progress(stats):
+        finished = stats["succeeded"] + stats["failed"]
+        if finished % 50 == 0:
+            print(f"{finished} done, {stats['failed']} failed, {stats['skipped']} skipped, {stats['seconds']:.0f}s", file=sys.stderr)
+
+    stats = asyncio.run(arun_batch(
+        args.input, args.output, args.model, system_message=args.system_message, username=args.username,
+        system_prompt=args.system_prompt, max_tokens=args.max_tokens, concurrency=args.concurrency,
+        config_path=args.config, user_config_path=args.user_config, progress=progress))
+    print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+import urllib.request
+
+SCENARIOS = ("chat", "assistant", "web-chat", "web-assistant")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_server(args):
+    """在子程序啟動模擬伺服器，讓測量到的CPU與記憶體只包含用戶端。
+
+    Returns:
+        tuple: 子程序與端點。
+    """
+    port = _free_port()
+    process = subprocess.Popen([
+        sys.executable, "-m", "ChatGPT_Web.mock_azure",
+        "--port", str(port),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--latency", str(args.latency),
+        "--rate-limit-ratio", str(args.rate_limit_ratio),
+        "--completion-tokens", str(args.completion_tokens),
+    ], stdout=subprocess.DEVNULL)
+    endpoint = f"http://127.0.0.1:{port}/"
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            urllib.request.urlopen(urllib.request.Request(endpoint, method="HEAD"), timeout=1)
+            return process, endpoint
+        except OSError:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.kill()
+                raise RuntimeError("The mock server did not start.")
+            time.sleep(0.1)
+
+
+def write_configs(directory, endpoint, quota=None):
+    """建立指向模擬伺服器的 model_config.json 與 user_config.json。
+
+    Args:
+        directory (str): 保存配置的資料夾。
+        endpoint (str): 模擬伺服器的端點。
+        quota (dict, optional): 各部署的配額，None 表示不限制。
+
+    Returns:
+        tuple: model_config.json 與 user_config.json 的路徑。
+    """
+    def deployment(name, api_version="2024-02-01", **extra):
+        config = {"deployment": name, "endpoint": endpoint, "key": "mock", "api-version": api_version, **extra}
+        if quota:
+            config["quota"] = quota
+        return config
+
+    model_list = [
+        {"model_name": "GPT-3.5 Turbo", **deployment("gpt-35-turbo"), "context_window": {"max_tokens": 16385}},
+        {"model_name": "GPT-4 Turbo", **deployment("gpt-4-turbo"), "context_window": {"max_tokens": 128000}},
+        {"model_name": "GPT-4 Vision", **deployment("gpt-4-vision", cv_endpoint=endpoint, cv_key="mock")},
+        {"model_name": "Dall-E-3", **deployment("dall-e-3")},
+        {
+            "model_name": "Assistants",
+            "GPT-3.5 Turbo": deployment("gpt-35-turbo", "2024-02-15-preview"),
+            "GPT-4 Turbo": deployment("gpt-4-turbo", "2024-02-15-preview"),
+        },
+    ]
+    for config in model_list:
+        config.setdefault("model_info", "")
+        config.setdefault("deployment_info", "")
+    system_messages = {"default": "You are a helpful assistant.", "Assistants": "You are a helpful assistant."}
+    user_config = [{"nick": "nick"}, {"nick": system_messages}]
+    config_path = os.path.join(directory, "model_config.json")
+    user_config_path = os.path.join(directory, "user_config.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(model_list, f)
+    with open(user_config_path, "w", encoding="utf-8") as f:
+        json.dump(user_config, f)
+    return config_path, user_config_path
+
+
+class StreamRecorder:
+    def __init__(self):
+        """記錄每個串流的開始、首個輸出與結束時間以及輸出的token數。"""
+        self.started = time.perf_counter()
+        self.first = None
+        self.tokens = 0
+        self.error = None
+
+    def output(self, text):
+        if not text:
+            return
+        if self.first is None:
+            self.first = time.perf_counter()
+        self.tokens += len(text.split())
+
+    def result(self):
+        ended = time.perf_counter()
+        return {
+            "ttft": None if self.first is None else self.first - self.started,
+            "duration": ended - self.started,
+            "tokens": self.tokens,
+            "error": self.error,
+        }
+
+
+def run_chat(args, config_path):
+    """以多個執行緒模擬使用者呼叫 ChatGPT.get_response。"""
+    from ChatGPT_Web.call_gpt import ChatGPT
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)[0]
+
+    def user(index):
+        chatgpt = ChatGPT(config, {"role": "system", "content": "You are a helpful assistant."})
+        results = []
+        for _ in range(args.requests):
+            recorder = StreamRecorder()
+            for event in chatgpt.get_response(args.prompt, args.max_tokens, f"user{index}", delta=True):
+                if event.type == "delta":
+                    recorder.output(event.content)
+                elif event.type == "error":
+                    recorder.error = event.content
+            results.append(recorder.result())
+        return results
+
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        return [result for results in executor.map(user, range(args.users)) for result in results]
+
+
+def run_assistant(args, config_path):
+    """以多個執行緒模擬使用者呼叫 ChatGPT.assistant_stream_output。"""
+    from ChatGPT_Web.call_gpt import ChatGPT
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)[4]
+
+    def user(index):
+        chatgpt = ChatGPT(config, {"role": "system", "content": "You are a helpful assistant."})
+        results = []
+        for _ in range(args.requests):
+            recorder = StreamRecorder()
+            for text, _, _, _ in chatgpt.assistant_stream_output(args.prompt, [], "GPT-3.5 Turbo", ""):
+                if text and text.startswith("An error occurred"):
+                    recorder.error = text
+                elif text and text.startswith("tok"):
+                    recorder.output(text)
+            results.append(recorder.result())
+        return results
+
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        return [result for results in executor.map(user, range(args.users)) for result in results]
+
+
+def run_web(args, config_path, user_config_path, assistant):
+    """以同一個事件迴圈中的多個工作模擬使用者呼叫 WebBot.slow_echo 或 WebBot.assistant_echo。"""
+    from ChatGPT_Web.web_gpt import WebBot
+
+    directory = os.path.dirname(config_path)
+    web = WebBot(config_path, session_path=os.path.join(directory, "sessions.db"), user_config_path=user_config_path)
+
+    async def user(index):
+        username = f"user{index}"
+        web.config_store.set_system_message(username, "default", "You are a helpful assistant.")
+        web.config_store.set_system_message(username, "Assistants", "You are a helpful assistant.")
+        request = types.SimpleNamespace(username=username, session_hash=f"bench{index}")
+        results = []
+        for _ in range(args.requests):
+            recorder = StreamRecorder()
+            message = {"text": args.prompt, "files": []}
+            if assistant:
+                stream = web.assistant_echo(message, [], "Assistants", "GPT-3.5 Turbo", "", request)
+            else:
+                stream = web.slow_echo(message, [], "GPT-3.5 Turbo", args.max_tokens, "You are a helpful assistant.", request)
+            seen = 0
+            async for response in stream:
+                if response.startswith("An error occurred") or response.startswith("error occurred"):
+                    recorder.error = response
+                recorder.output(response[seen:].replace("Response:", ""))
+                seen = len(response)
+            results.append(recorder.result())
+        return results
+
+    async def main():
+        groups = await asyncio.gather(*(user(index) for index in range(args.users)))
+        return [result for results in groups for result in results]
+
+    return asyncio.run(main())
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+def summarize(name, results, wall, cpu, memory_growth, memory_peak):
+    """計算單一情境的統計結果。
+
+    Returns:
+        dict: 首個token時間、吞吐量、每個串流的CPU時間與記憶體增長。
+    """
+    succeeded = [result for result in results if result["error"] is None and result["ttft"] is not None]
+    ttft = [result["ttft"] for result in succeeded]
+    tokens = sum(result["tokens"] for result in succeeded)
+    per_stream = [
+        result["tokens"] / (result["duration"] - result["ttft"])
+        for result in succeeded if result["duration"] > result["ttft"]
+    ]
+    return {
+        "scenario": name,
+        "streams": len(results),
+        "errors": len(results) - len(succeeded),
+        "ttft_p50": _percentile(ttft, 50),
+        "ttft_p95": _percentile(ttft, 95),
+        "tokens_per_second": tokens / wall if wall else None,
+        "stream_tokens_per_second": statistics.mean(per_stream) if per_stream else None,
+        "cpu_ms_per_stream": cpu * 1000 / len(results) if results else None,
+        "memory_growth_kb": memory_growth / 1024,
+        "memory_peak_kb": memory_peak / 1024,
+        "wall_seconds": wall,
+    }
+
+
+def run_scenario(name, args, config_path, user_config_path):
+    """執行一個情境並測量牆鐘時間、CPU時間與記憶體。"""
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    if name == "chat":
+        results = run_chat(args, config_path)
+    elif name == "assistant":
+        results = run_assistant(args, config_path)
+    else:
+        results = run_web(args, config_path, user_config_path, assistant=(name == "web-assistant"))
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summarize(name, results, wall, cpu, after - before, peak)
+
+
+def format_report(reports):
+    """將結果整理成文字表格。"""
+    columns = [
+        ("scenario", "{}"), ("streams", "{}"), ("errors", "{}"), ("ttft_p50", "{:.3f}"), ("ttft_p95", "{:.3f}"),
+        ("tokens_per_second", "{:.1f}"), ("stream_tokens_per_second", "{:.1f}"), ("cpu_ms_per_stream", "{:.2f}"),
+        ("memory_growth_kb", "{:.0f}"), ("memory_peak_kb", "{:.0f}"),
+    ]
+    rows = [[name for name, _ in columns]]
+    for report in reports:
+        rows.append(["-" if report[name] is None else fmt.format(report[name]) for name, fmt in columns])
+    widths = [max(len(row[index]) for row in rows) for index in range(len(columns))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chat hot paths against a local mock Azure OpenAI server.")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--users", type=int, default=20, help="Number of simulated concurrent users.")
+    parser.add_argument("--requests", type=int, default=3, help="Requests sent by each user.")
+    parser.add_argument("--prompt", default="Tell me a story.")
+    parser.add_argument("--max-tokens", type=int, default=800)
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--tpm", type=int, help="Apply a client-side TPM quota to every deployment.")
+    parser.add_argument("--rpm", type=int, help="Apply a client-side RPM quota to every deployment.")
+    parser.add_argument("--endpoint", help="Use an already running mock server instead of starting one.")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    quota = {key: value for key, value in (("tpm", args.tpm), ("rpm", args.rpm)) if value}
+    process = None
+    if args.endpoint:
+        endpoint = args.endpoint
+    else:
+        process, endpoint = start_mock_server(args)
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            config_path, user_config_path = write_configs(directory, endpoint, quota or None)
+            # 快取與下載的檔案寫在暫存資料夾，不影響正式環境
+            os.chdir(directory)
+            try:
+                scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+                reports = [run_scenario(name, args, config_path, user_config_path) for name in scenarios]
+            finally:
+                os.chdir(cwd)
+    finally:
+        if process is not None:
+            process.terminate()
+    print(format_report(reports))
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
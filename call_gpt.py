@@ -1,17 +1,67 @@
-import base64
+import asyncio
 import json
-import requests
+import time
 
+import httpx
+import litellm
+import openai
+import traceback
 
-from openai import AzureOpenAI
+from ChatGPT_Web.assistants import assistant_registry
+from ChatGPT_Web.client_pool import client_registry
+from ChatGPT_Web.context_window import ContextWindow
+from ChatGPT_Web.file_store import upload_cache
+from ChatGPT_Web.image_store import image_store
+from ChatGPT_Web.image_utils import image_encoder
+from ChatGPT_Web.metrics import RequestTracker
+from ChatGPT_Web.rate_limit import QuotaExceeded, limiter_registry
+from ChatGPT_Web.response_cache import cache_registry
+from ChatGPT_Web.router import router_registry
+from ChatGPT_Web.streaming import StreamEvent, aaccumulate, iter_sync, run_sync
 
 
-import litellm
-import traceback
 
-from PIL import Image
-import io
+def _is_rate_limited(error):
+    """判斷錯誤是否為上游回傳的429。"""
+    return getattr(error, "status_code", None) == 429
+
+
+def _is_timeout(error):
+    """判斷錯誤是否為逾時或連線失敗。"""
+    return isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException, openai.APIConnectionError))
+
+
+async def _aclose(stream):
+    """關閉上游的串流回應，釋放連線。litellm 的串流包裝沒有 close 時關閉其內部的串流。"""
+    for target in (stream, getattr(stream, "completion_stream", None)):
+        close = getattr(target, "aclose", None) or getattr(target, "close", None)
+        if close is not None:
+            result = close()
+            if asyncio.iscoroutine(result):
+                await result
+            return
+
+
+async def _chain(received, iterator):
+    """先輸出已收到的區塊，再輸出串流其餘的區塊。"""
+    for chunk in received:
+        yield chunk
+    async for chunk in iterator:
+        yield chunk
+
 
+def _is_stream_unsupported(error):
+    """判斷錯誤是否為部署不支援串流所回傳的400。"""
+    return getattr(error, "status_code", None) == 400 and "stream" in str(error).lower()
+
+
+def _retry_after(error, attempt):
+    """依回應的 retry-after 標頭決定重試前等待的秒數，沒有時以指數退避。"""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except Exception:
+        return 2 ** attempt
 
 
 class ChatGPT:
@@ -29,6 +79,9 @@ class ChatGPT:
             }
         self.messages = [init_system]  # 初始化訊息列表，包含初始系統訊息
         self.model_config = model_config  # 儲存模型配置
+        self.context = ContextWindow.from_config(model_config)  # 控制每次請求的token預算
+        self.max_retries = 3  # 收到429時在輸出任何內容前重試的次數
+        self.last_turn = []  # 最近一輪成功對話新增的訊息，供保存對話紀錄使用
         self.assistant_sys = """你是一個可以根據用戶問題撰寫代碼並執行的有用AI助手。請注意代碼與所有檔案名稱以及圖像的文字應該以英文命名與展示。敘述與說明的部分應該以繁體中文展示。
                             你擁有一個隔離的環境用於編寫和測試代碼。若是遇到編碼錯誤請優先考慮UTF-8的編碼。一個簡單的案例如下:
                             - 當要求你創建視覺化時，你應該遵循以下步驟：
@@ -46,113 +99,412 @@ class ChatGPT:
                             """
         if model_config["model_name"] == "Assistants":
             self.use_model = "GPT-3.5 Turbo"  # 根據配置設定使用的模型
-            self.client, self.assistant, self.thread = self.create_assistant()  # 設定並創建AI助手
+            # 助手與線程在第一次發送訊息時才建立，避免登入時就進行網路請求
+            self.client = None
+            self.assistant = None
+            self.thread = None
+            self.thread_key = None
+            self.threads = {}  # 依Azure資源保存使用者的 (線程, 線程看過的最後一則紀錄)，切換到同資源的模型時可直接沿用
+            self.transcript = []  # 文字對話紀錄，切換到其他資源時用來延續對話
+            self.max_transcript = 40  # 保留的對話紀錄則數上限
+            self.pending_cancel = None  # 取消被中斷的 run 的 Task，下一則訊息送出前需等待完成
+
 
+    def update_config(self, model_config):
+        """套用新的模型配置並保留目前的對話。
+
+        Args:
+            model_config (dict): 新的模型配置。
+        """
+        self.model_config = model_config
+        self.context = ContextWindow.from_config(model_config)
+        if model_config["model_name"] == "Assistants":
+            if self.use_model not in model_config:
+                self.use_model = "GPT-3.5 Turbo"
+            self.thread = None  # 下一次發送訊息時依新的配置取得助手，線程依資源沿用
 
-    def _handle_default_model(self, question, max_tokens, image_path, user):
-        """專門處理標準GPT模型流式輸出。
+    async def _astream_default_model(self, question, max_tokens, image_path, user):
+        """以增量事件的方式處理標準GPT模型的流式輸出。
         
         Args:
             question (str): 用戶的提問。
             max_tokens (int): 最大 token 數。
             image_path (str, optional): 圖片的路徑，如果有的話。
             user (str): 使用者身份標識。
+
+        Yields:
+            StreamEvent: 新增的文字、排隊、用量與結束資訊。
         """
-        partial_message = ""
+        parts = []
+        self.last_turn = []
         if "翻譯" in self.messages[0]["content"]:
-            self.messages.append({"role": "user", "content": "翻譯下列內容:\n\n#####"+question+"#####"})  # 增加翻譯請求的訊息
+            turn = [{"role": "user", "content": "翻譯下列內容:\n\n#####"+question+"#####"}]  # 增加翻譯請求的訊息
         else:
-            self.messages.append({"role": "user", "content": question})  # 添加用戶的問題到訊息列表
-        try:
-            # 若有圖片路徑，處理圖片和訊息
-            if image_path:
-                message_content = [{"type": "image_url", "image_url": f"data:image/jpeg;base64,{self._get_base64_from_image(path)}"} for path in image_path] + [{"type": "text", "text": question}]
-                self.messages.append({"role": "user", "content": message_content})
-                for chunk in AzureOpenAI(
-                    api_key=self.model_config["key"], 
-                    api_version=self.model_config["api-version"], 
-                    base_url=self.model_config["endpoint"]+"/openai/deployments/"+self.model_config["deployment"]
-                    ).chat.completions.create(
-                        model=self.model_config["deployment"], 
-                        messages=self.messages, 
-                        max_tokens=max_tokens, 
-                        stream=True
-                        ):
-                    if chunk.choices and chunk.choices[0].delta.content:
-                        partial_message += chunk.choices[0].delta.content
-                    yield partial_message
-                self.messages.append({"role": "assistant", "content": partial_message})
-                yield partial_message
-            else:
-                # 處理純文字訊息
-                for chunk in litellm.completion(
-                    model="azure/"+self.model_config["deployment"], 
-                    api_base=self.model_config["endpoint"], 
-                    api_key=self.model_config["key"], 
-                    api_version=self.model_config["api-version"], 
-                    max_tokens=max_tokens, 
+            turn = [{"role": "user", "content": question}]  # 添加用戶的問題到訊息列表
+        self.messages.append(turn[0])
+        # 與歷史無關的系統訊息(例如翻譯)可以直接使用快取的回答
+        cache = cache_registry.get(self.model_config)
+        cache_key = None
+        if cache and not image_path and cache.applies_to(self.messages[0]["content"]):
+            deployment = self.model_config.get("deployment", self.model_config["model_name"])  # 多區域的模型以名稱區分
+            cache_key = cache.make_key(deployment, self.messages[0]["content"], question, max_tokens=max_tokens)
+            cached = await asyncio.to_thread(cache.get, cache_key)
+            if cached is not None:
+                turn.append({"role": "assistant", "content": cached})
+                self.messages.append(turn[-1])
+                self.last_turn = turn
+                yield StreamEvent("delta", cached)
+                yield StreamEvent("finish", data={"finish_reason": "stop", "cached": True})
+                return
+        finish_reason = None
+        with RequestTracker(self.model_config) as tracker:
+            try:
+                # 若有圖片路徑，處理圖片和訊息
+                if image_path:
+                    image_urls = await asyncio.to_thread(image_encoder.encode_many, image_path)
+                    message_content = [{"type": "image_url", "image_url": url} for url in image_urls] + [{"type": "text", "text": question}]
+                    turn.append({"role": "user", "content": message_content})
+                    self.messages.append(turn[-1])
+                self.messages = self.context.fit(self.messages, max_tokens)
+                tracker.prompt(self.context.total(self.messages))
+                tokens = self.context.total(self.messages) + max_tokens
+                # 多區域的模型依健康狀態排序，429或逾時時在輸出任何內容前改用下一個區域
+                router = router_registry.get(self.model_config)
+                candidates = router.candidates()
+                first_token_timeout = (self.model_config.get("routing") or {}).get("first_token_timeout")
+                hedge = self.model_config.get("hedge") or {}
+                for attempt in range(self.max_retries + 1):
+                    config = candidates[attempt % len(candidates)]
+                    failover = attempt + 1 < len(candidates)
+                    # 對沖請求送往下一個區域，只有一個區域時送往同一個部署
+                    hedge_config = candidates[(attempt + 1) % len(candidates)] if hedge.get("enabled") else None
+                    tracker.route(config)
+                    try:
+                        waited = time.monotonic()
+                        async for event in self._admit(config, tokens):
+                            yield event
+                        tracker.queued(time.monotonic() - waited)
+                    except QuotaExceeded:
+                        if not failover:
+                            raise
+                        continue  # 此區域的配額已滿，改用下一個區域
+                    stream = None
+                    try:
+                        config, stream, iterator, received, ttft = await self._start_stream(
+                            config, max_tokens, user, bool(image_path), first_token_timeout,
+                            hedge_config, hedge.get("delay", 2), tokens, router, tracker)
+                        router.success(config, ttft)
+                        async for chunk in _chain(received, iterator):
+                            for event in self._chunk_events(chunk, parts):
+                                tracker.observe(event)
+                                if event.type == "finish":
+                                    finish_reason = event.data["finish_reason"]
+                                yield event
+                        break
+                    except Exception as e:
+                        retryable = _is_rate_limited(e) or _is_timeout(e)
+                        if _is_rate_limited(e):
+                            tracker.rate_limited()
+                        if retryable:
+                            router.failure(config)
+                        # 只有在尚未輸出任何內容時才能重試
+                        if parts or attempt == self.max_retries or not retryable:
+                            raise
+                        if failover:
+                            continue  # 立即改用下一個區域
+                        delay = _retry_after(e, attempt)
+                        yield StreamEvent("queue", data={"wait": delay})
+                        await asyncio.sleep(delay)
+                    finally:
+                        if stream is not None:
+                            await _aclose(stream)  # 結束、失敗或使用者中斷時立即釋放上游連線
+                turn.append({"role": "assistant", "content": "".join(parts)})
+                self.messages.append(turn[-1])
+                self.last_turn = turn
+                # 只快取完整結束的回答
+                if cache_key and finish_reason == "stop":
+                    await asyncio.to_thread(cache.set, cache_key, turn[-1]["content"])
+            except QuotaExceeded as e:
+                tracker.fail("quota_exceeded")
+                yield StreamEvent("error", str(e))
+            except Exception:
+                tracker.fail()
+                yield StreamEvent("error", f"error occurred: {traceback.format_exc()}")
+
+    async def _open_stream(self, config, max_tokens, user, multimodal):
+        """對部署送出串流請求。
+
+        Args:
+            config (dict): 要送出請求的區域配置。
+            max_tokens (int): 最大 token 數。
+            user (str): 使用者身份標識。
+            multimodal (bool): 訊息是否包含圖片。
+
+        Returns:
+            串流回應的非同步迭代器。
+        """
+        if multimodal:
+            return await client_registry.get_async_for(config, per_deployment=True).chat.completions.create(
+                    model=config["deployment"], 
                     messages=self.messages, 
-                    stream=True, 
-                    user=user
-                    ):
-                    if chunk['choices'][0]['delta']['content']:
-                        partial_message += chunk['choices'][0]['delta']['content']
-                    yield partial_message
-                self.messages.append({"role": "assistant", "content": partial_message})
-                yield partial_message
-        except:
-            e = f"error occurred: {traceback.format_exc()}"
-            for i in e:
-                partial_message += i
-                yield partial_message
-
-    def _handle_vision_model(self, question, max_tokens, image_path, user):
-        """專門處理有視覺輸入的GPT模型。
+                    max_tokens=max_tokens, 
+                    stream=True
+                    )
+        # 處理純文字訊息
+        return await litellm.acompletion(
+            model="azure/"+config["deployment"], 
+            api_base=config["endpoint"], 
+            api_key=config["key"], 
+            api_version=config["api-version"], 
+            max_tokens=max_tokens, 
+            messages=self.messages, 
+            stream=True, 
+            user=user,
+            client=client_registry.get_async_for(config)
+            )
+
+    async def _first_chunk(self, config, max_tokens, user, multimodal):
+        """送出串流請求並等待第一個區塊，失敗或被取消時關閉連線。
+
+        Args:
+            config (dict): 要送出請求的區域配置。
+            max_tokens (int): 最大 token 數。
+            user (str): 使用者身份標識。
+            multimodal (bool): 訊息是否包含圖片。
+
+        Returns:
+            tuple: 區域配置、串流、串流的迭代器、已收到的區塊列表與收到第一個區塊的秒數。
+        """
+        started = time.monotonic()
+        stream = await self._open_stream(config, max_tokens, user, multimodal)
+        iterator = stream.__aiter__()
+        try:
+            received = [await iterator.__anext__()]
+        except StopAsyncIteration:
+            received = []
+        except BaseException:
+            await _aclose(stream)
+            raise
+        return config, stream, iterator, received, time.monotonic() - started
+
+    async def _start_stream(self, config, max_tokens, user, multimodal, timeout, hedge_config, hedge_delay, tokens, router, tracker):
+        """取得第一個區塊，啟用對沖時若超過延遲仍沒有回應，對 hedge_config 送出相同的請求，採用先回應的串流並立即取消另一個。
+
+        對沖請求只在部署的配額不需要等待時送出，並計入該部署的TPM/RPM配額，避免在壅塞時加倍請求造成更多429。
+
+        Args:
+            config (dict): 主要請求的區域配置。
+            max_tokens (int): 最大 token 數。
+            user (str): 使用者身份標識。
+            multimodal (bool): 訊息是否包含圖片。
+            timeout (float, optional): 等待第一個區塊的秒數，None 表示不限制。
+            hedge_config (dict, optional): 對沖請求的區域配置，None 表示不對沖。
+            hedge_delay (float): 送出對沖請求前等待的秒數。
+            tokens (int): 對沖請求要取得的token配額。
+            router (EndpointRouter): 記錄區域健康狀態的路由器。
+            tracker (RequestTracker): 記錄指標的追蹤器。
+
+        Returns:
+            tuple: 先回應的區域配置、串流、串流的迭代器、已收到的區塊列表與收到第一個區塊的秒數。
+
+        Raises:
+            asyncio.TimeoutError: 超過 timeout 秒仍沒有任何請求回應。
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        hedge_at = None if hedge_config is None else loop.time() + hedge_delay
+        primary = asyncio.ensure_future(self._first_chunk(config, max_tokens, user, multimodal))
+        configs = {primary: config}
+        pending = {primary}
+        failed = []
+
+        def record_failures(include_primary):
+            # 拋出的錯誤由呼叫者記錄，這裡只記錄其他請求的錯誤
+            for task in failed:
+                error = task.exception()
+                if (task is primary and not include_primary) or not (_is_rate_limited(error) or _is_timeout(error)):
+                    continue
+                if _is_rate_limited(error):
+                    tracker.rate_limited(configs[task])
+                router.failure(configs[task])
+
+        try:
+            while True:
+                waits = [moment - loop.time() for moment in (deadline, hedge_at) if moment is not None]
+                done, pending = await asyncio.wait(pending, timeout=max(0, min(waits)) if waits else None,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+                failed += [task for task in done if task is not winner and task.exception() is not None]
+                if winner is not None:
+                    for task in done:
+                        if task is not winner and task.exception() is None:
+                            await _aclose(task.result()[1])  # 兩個請求同時回應時關閉較晚的串流
+                    if len(configs) > 1:
+                        tracker.route(configs[winner])
+                        tracker.hedged("primary" if winner is primary else "hedge")
+                    record_failures(include_primary=True)
+                    return winner.result()
+                if not pending:
+                    record_failures(include_primary=False)
+                    raise primary.exception()
+                if hedge_at is not None and loop.time() >= hedge_at:
+                    hedge_at = None
+                    if self._try_admit(hedge_config, tokens):
+                        task = asyncio.ensure_future(self._first_chunk(hedge_config, max_tokens, user, multimodal))
+                        configs[task] = hedge_config
+                        pending.add(task)
+                if deadline is not None and loop.time() >= deadline:
+                    record_failures(include_primary=False)
+                    raise asyncio.TimeoutError()
+        finally:
+            for task in pending:
+                task.cancel()  # 立即取消較慢的請求，_first_chunk 會關閉其連線
+
+    def _try_admit(self, config, tokens=0):
+        """不等待地取得部署的配額。
+
+        Args:
+            config (dict): 部署的模型配置。
+            tokens (int): 預估的 prompt token 數加上 max_tokens。
+
+        Returns:
+            bool: 是否可以立即送出請求。
+        """
+        limiter = limiter_registry.get(config)
+        return limiter is None or limiter.try_reserve(tokens)
+
+    async def _admit(self, config, tokens=0):
+        """送出請求前取得部署的TPM/RPM配額，需要等待時先輸出排隊事件。
+
+        Args:
+            config (dict): 部署的模型配置。
+            tokens (int): 預估的 prompt token 數加上 max_tokens。
+
+        Yields:
+            StreamEvent: 排隊事件，data 中的 wait 為預計等待的秒數。
+        """
+        limiter = limiter_registry.get(config)
+        if limiter is None:
+            return
+        delay = limiter.reserve(tokens)
+        if delay > 0:
+            yield StreamEvent("queue", data={"wait": delay})
+            await limiter.wait(delay, tokens)
+
+    def _chunk_events(self, chunk, parts):
+        """將一個串流區塊轉換為增量事件。
+
+        Args:
+            chunk: litellm 或 openai 回傳的串流區塊。
+            parts (list): 收集目前為止所有增量文字的列表。
+
+        Yields:
+            StreamEvent: 區塊中包含的事件。
+        """
+        usage = getattr(chunk, "usage", None)
+        if usage:
+            yield StreamEvent("usage", data={
+                "prompt_tokens": getattr(usage, "prompt_tokens", None),
+                "completion_tokens": getattr(usage, "completion_tokens", None),
+            })
+        if not chunk.choices:
+            return
+        choice = chunk.choices[0]
+        content = choice.delta.content
+        if content:
+            parts.append(content)
+            yield StreamEvent("delta", content)
+        if choice.finish_reason:
+            yield StreamEvent("finish", data={"finish_reason": choice.finish_reason})
+
+    async def _astream_vision_model(self, question, max_tokens, image_path, user):
+        """以增量事件的方式處理有視覺輸入的GPT模型。
         
         Args:
             question (str): 用戶的提問。
             max_tokens (int): 最大 token 數。
             image_path (str, optional): 圖片的路徑，如果有的話。
             user (str): 使用者身份標識。
+
+        Yields:
+            StreamEvent: 新增的文字與結束資訊。
         """
-        partial_message = ""
-        try:
-            # 處理圖片訊息以及文字內容
-            if image_path:
-                message_content = [{"type": "image_url", "image_url": f"data:image/jpeg;base64,{self._get_base64_from_image(path)}"} for path in image_path] + [{"type": "text", "text": question}]
-                self.messages.append({"role": "user", "content": message_content})
-                url = self.model_config["endpoint"] + "openai/deployments/"+self.model_config["deployment"]+"/extensions"
-                response = litellm.completion(
-                        model="azure/gpt4-v",
-                        api_key=self.model_config["key"],
-                        api_version=self.model_config["api-version"],
-                        messages=self.messages,
-                        max_tokens=max_tokens,
-                        base_url=url,
-                        enhancements={"ocr": {"enabled": True}, "grounding": {"enabled": True}},
-                        dataSources=[
-                            {
-                                "type": "AzureComputerVision",
-                                "parameters": {
-                                    "endpoint": self.model_config["cv_endpoint"],
-                                    "key": self.model_config["cv_key"],
-                                },
-                            }
-                        ],
-                        user=user
-                )
-                for item in response['choices'][0]['message']['content']:
-                    partial_message += item
-                    yield partial_message
-                self.messages.append({"role": "assistant", "content": partial_message})
-        except:
-            e = f"error occurred: {traceback.format_exc()}"
-            for i in e:
-                partial_message += i
-                yield partial_message
+        self.last_turn = []
+        with RequestTracker(self.model_config) as tracker:
+            try:
+                # 處理圖片訊息以及文字內容
+                if image_path:
+                    image_urls = await asyncio.to_thread(image_encoder.encode_many, image_path)
+                    message_content = [{"type": "image_url", "image_url": url} for url in image_urls] + [{"type": "text", "text": question}]
+                    turn = [{"role": "user", "content": message_content}]
+                    self.messages.append(turn[0])
+                    self.messages = self.context.fit(self.messages, max_tokens)
+                    tracker.prompt(self.context.total(self.messages))
+                    url = self.model_config["endpoint"] + "openai/deployments/"+self.model_config["deployment"]+"/extensions"
+                    waited = time.monotonic()
+                    async for event in self._admit(self.model_config, self.context.total(self.messages) + max_tokens):
+                        yield event
+                    tracker.queued(time.monotonic() - waited)
+                    request = dict(
+                            model="azure/gpt4-v",
+                            api_key=self.model_config["key"],
+                            api_version=self.model_config["api-version"],
+                            messages=self.messages,
+                            max_tokens=max_tokens,
+                            base_url=url,
+                            enhancements={"ocr": {"enabled": True}, "grounding": {"enabled": True}},
+                            dataSources=[
+                                {
+                                    "type": "AzureComputerVision",
+                                    "parameters": {
+                                        "endpoint": self.model_config["cv_endpoint"],
+                                        "key": self.model_config["cv_key"],
+                                    },
+                                }
+                            ],
+                            user=user
+                    )
+                    parts = []
+                    fallback = not self.model_config.get("stream", True)
+                    if not fallback:
+                        stream = None
+                        received = False
+                        try:
+                            stream = await litellm.acompletion(stream=True, **request)
+                            async for chunk in stream:
+                                received = True
+                                for event in self._chunk_events(chunk, parts):
+                                    tracker.observe(event)
+                                    yield event
+                        except Exception as e:
+                            # 只有部署不支援串流時才改用一次性請求，其他錯誤重送只會再次失敗或重複計費
+                            if received or not _is_stream_unsupported(e):
+                                raise
+                            fallback = True  # 被拒絕的串流請求沒有產生回答，沿用已取得的配額
+                        finally:
+                            if stream is not None:
+                                await _aclose(stream)
+                    if fallback:
+                        # 等待完整回答後一次輸出
+                        response = await litellm.acompletion(**request)
+                        parts = [response['choices'][0]['message']['content'] or ""]
+                        tracker.token(self.context.count({"role": "assistant", "content": parts[0]}))
+                        yield StreamEvent("delta", parts[0])
+                        yield StreamEvent("finish", data={"finish_reason": response['choices'][0].get('finish_reason')})
+                    turn.append({"role": "assistant", "content": "".join(parts)})
+                    self.messages.append(turn[-1])
+                    self.last_turn = turn
+            except QuotaExceeded as e:
+                tracker.fail("quota_exceeded")
+                yield StreamEvent("error", str(e))
+            except Exception as e:
+                if _is_rate_limited(e):
+                    tracker.rate_limited()
+                tracker.fail()
+                yield StreamEvent("error", f"error occurred: {traceback.format_exc()}")
 
     def get_image(self, prompt, Image_size, Image_style, Image_Quality, user):
-        """根據提示生成圖像。
+        """根據提示生成圖像，為 aget_image 的同步版本。
 
         Args:
             prompt (str): 圖像生成的提示語。
@@ -162,65 +514,189 @@ class ChatGPT:
             user (str): 使用者身份。
         
         Returns:
-            tuple: 包含修正後的提示和生成的圖像對象。
+            tuple: 包含修正後的提示和圖像的檔案路徑。
         """
+        return run_sync(self.aget_image(prompt, Image_size, Image_style, Image_Quality, user))
+
+    async def aget_image(self, prompt, Image_size, Image_style, Image_Quality, user, variant=0, on_queue=None):
+        """根據提示生成圖像，相同參數的圖像直接從磁碟快取取得。
+
+        Args:
+            prompt (str): 圖像生成的提示語。
+            Image_size (str): 圖像尺寸。
+            Image_style (str): 圖像風格。
+            Image_Quality (str): 圖像質量。
+            user (str): 使用者身份。
+            variant (int): 同一組參數的第幾張變化圖，不同的變化圖分開快取。
+            on_queue (callable, optional): 需要等待部署配額時以預計等待的秒數呼叫。
+        
+        Returns:
+            tuple: 包含修正後的提示和圖像的檔案路徑。
+        """
+        key = image_store.make_key(self.model_config["deployment"], prompt, Image_size, Image_style, Image_Quality, variant)
         try:
-            response = litellm.image_generation(  # 調用圖像生成模型
-                model="azure/dall-e-3",
-                prompt=prompt,
-                api_key=self.model_config["key"],
-                api_base=self.model_config["endpoint"],
-                api_version=self.model_config["api-version"],
-                size=Image_size,
-                quality=Image_Quality,
-                style=Image_style,
-                n=1,
-                user=user
-            )
-            img_response = requests.get(response.data[0]["url"])  # 從返回的URL獲取圖像數據
-            img = Image.open(io.BytesIO(img_response.content))  # 打開並轉換圖像數據為PIL圖像
-            return response.data[0]["revised_prompt"], img  # 返回修正後的提示和圖像對象
+            cached = await asyncio.to_thread(image_store.lookup, key)
+            if cached is not None:
+                return cached["revised_prompt"], cached["path"]
+            with RequestTracker(self.model_config) as tracker:
+                try:
+                    waited = time.monotonic()
+                    async for event in self._admit(self.model_config):
+                        if on_queue is not None:
+                            on_queue(event.data["wait"])
+                    tracker.queued(time.monotonic() - waited)
+                    response = await litellm.aimage_generation(  # 調用圖像生成模型
+                        model="azure/dall-e-3",
+                        prompt=prompt,
+                        api_key=self.model_config["key"],
+                        api_base=self.model_config["endpoint"],
+                        api_version=self.model_config["api-version"],
+                        size=Image_size,
+                        quality=Image_Quality,
+                        style=Image_style,
+                        n=1,
+                        user=user
+                    )
+                    path = await image_store.download(response.data[0]["url"])  # 串流寫入以內容雜湊命名的檔案
+                    thumbnail = await image_store.thumbnail(path)  # 在背景執行緒產生縮圖
+                    revised_prompt = response.data[0]["revised_prompt"]
+                    await asyncio.to_thread(image_store.remember, key, revised_prompt, path, thumbnail)
+                    return revised_prompt, path  # 返回修正後的提示和圖像路徑
+                except Exception as e:
+                    if _is_rate_limited(e):
+                        tracker.rate_limited()
+                    tracker.fail("quota_exceeded" if isinstance(e, QuotaExceeded) else "error")
+                    raise
         except Exception as e:
-            return e, None  # 异常處理，返回錯誤信息和None作為圖像對象
-        
-    def create_assistant(self, use_model="GPT-3.5 Turbo"):
-        """創建並初始化一個AI助手。
+            return e, None  # 异常處理，返回錯誤信息和None作為圖像路徑
+
+    async def aget_images(self, prompt, Image_size, Image_style, Image_Quality, user, n=1, on_queue=None):
+        """同時生成多張變化圖，請求會依部署的RPM配額排隊送出。
+
+        DALL-E 3 每次請求只能生成一張圖片，因此以多個並行的請求取代 n 參數。
 
         Args:
-            use_model (str, optional): 使用的模型配置名稱。預設為 "GPT-3.5 Turbo"。
+            prompt (str): 圖像生成的提示語。
+            Image_size (str): 圖像尺寸。
+            Image_style (str): 圖像風格。
+            Image_Quality (str): 圖像質量。
+            user (str): 使用者身份。
+            n (int): 生成的圖片數量。
+            on_queue (callable, optional): 需要等待部署配額時以預計等待的秒數呼叫。
+
+        Returns:
+            list: 每張圖片的 (修正後的提示, 圖像路徑)，失敗的圖片為 (錯誤, None)。
+        """
+        return await asyncio.gather(*(
+            self.aget_image(prompt, Image_size, Image_style, Image_Quality, user, variant, on_queue)
+            for variant in range(n)
+        ))
         
+    def select_model(self, use_model):
+        """切換助手使用的模型，已使用過的模型不需要重新建立助手或線程。
+
+        切換回先前使用過的資源時，會將在其他資源上進行的對話補進該資源的線程。
+
+        Args:
+            use_model (str): Assistants 配置中的模型名稱，例如 "GPT-4 Turbo"。
+        """
+        config = self.model_config[use_model]
+        self.client, self.assistant = assistant_registry.get(config)
+        # 線程只能在建立它的Azure資源中使用，因此以端點區分
+        thread_key = (config["endpoint"], config["key"])
+        entry = self.threads.get(thread_key)
+        if entry is None:
+            thread = self._create_thread(self.client)
+        else:
+            thread, seen = entry
+            missing = self._unseen(seen)
+            if missing is None:
+                # 線程看過的紀錄已被截斷，無法得知缺少哪些對話，改用帶入紀錄的新線程
+                thread = self._create_thread(self.client)
+            elif missing:
+                self.client.beta.threads.messages.create(thread_id=thread.id, role="user", content=self._history(
+                    "以下是在其他模型上進行的對話紀錄，請根據這些內容繼續對話:\n\n", missing))
+        self.thread = thread
+        self.thread_key = thread_key
+        self.use_model = use_model
+        self._mark_seen()
+
+    def _unseen(self, seen):
+        """找出線程尚未看過的對話紀錄。
+
+        Args:
+            seen (dict, optional): 線程看過的最後一則紀錄，None 表示沒有看過任何紀錄。
+
+        Returns:
+            list: 之後新增的紀錄；seen 已不在保留的紀錄中時回傳 None。
+        """
+        if seen is None:
+            return list(self.transcript)
+        for index in range(len(self.transcript) - 1, -1, -1):
+            if self.transcript[index] is seen:
+                return self.transcript[index + 1:]
+        return None
+
+    def _mark_seen(self):
+        """記錄目前的線程已包含到最新的一則對話紀錄。"""
+        if self.thread is not None:
+            self.threads[self.thread_key] = (self.thread, self.transcript[-1] if self.transcript else None)
+
+    @staticmethod
+    def _history(header, entries, max_turns=20):
+        """將對話紀錄整理為帶入線程的訊息內容。"""
+        return header + "\n\n".join(f"{item['role']}: {item['content']}" for item in entries[-max_turns:])
+
+    def _create_thread(self, client, max_turns=20):
+        """創建新的線程，若已有對話紀錄則一併帶入以延續先前的對話。
+
+        Args:
+            client (AzureOpenAI): 線程所屬資源的客戶端。
+            max_turns (int): 帶入的對話紀錄上限。
+
         Returns:
-            tuple: 包含客戶端、助手和線程的對象。
+            Thread: 新的線程。
         """
-        client = AzureOpenAI(  # 初始化客戶端
-            api_key=self.model_config[use_model]["key"],
-            api_version=self.model_config[use_model]["api-version"],
-            azure_endpoint=self.model_config[use_model]["endpoint"]
-        )
-        assistant = client.beta.assistants.create(  # 創建AI助手
-            name="code interpreter",
-            tools=[{"type": "code_interpreter"}],
-            model=self.model_config[use_model]["deployment"]
-        )
-        thread = client.beta.threads.create()  # 創建處理線程
-        return client, assistant, thread  # 返回組成元素
+        if not self.transcript:
+            return client.beta.threads.create()
+        return client.beta.threads.create(messages=[{
+            "role": "user",
+            "content": self._history("以下是先前的對話紀錄，請根據這些內容繼續對話:\n\n", self.transcript, max_turns)
+        }])
+
+    def reset_thread(self):
+        """捨棄目前所有的線程與對話紀錄，下一次發送訊息時會創建新的線程。"""
+        self.thread = None
+        self.threads = {}
+        self.transcript = []
     
-    def upload_file(self, file):
-        """上傳文件至AI助手。
+    def upload_file(self, file, use_model=None):
+        """上傳文件至AI助手，為 aupload_files 的同步版本。
 
         Args:
             file (str): 文件的路徑。
+            use_model (str, optional): 要使用的模型，文件會上傳到該模型所屬的資源。預設為目前的模型。
         
         Returns:
             list: 包含上傳文件的ID。
         """
-        file = self.client.files.create(  # 上傳文件
-            file=open(file, "rb"),
-            purpose='assistants'
-        )
-        return [file.id]  # 返回文件的ID列表
+        return run_sync(self.aupload_files([file], use_model))
+
+    async def aupload_files(self, files, use_model=None):
+        """同時上傳多個文件至AI助手，已上傳過的相同內容直接使用先前的文件ID。
+
+        Args:
+            files (list): 文件的路徑列表。
+            use_model (str, optional): 要使用的模型，文件會上傳到該模型所屬的資源。預設為目前的模型。
+
+        Returns:
+            list: 與輸入順序相同的文件ID列表。
+        """
+        config = self.model_config[use_model or self.use_model]
+        client = client_registry.get_async_for(config)
+        return list(await asyncio.gather(*(upload_cache.upload(client, config, file) for file in files)))
     
-    def get_response(self, question, max_tokens, user, image_path=None, system_message=""):
+    def get_response(self, question, max_tokens, user, image_path=None, system_message="", delta=False):
         """根據提問得到GPT的回答。
 
         Args:
@@ -229,6 +705,20 @@ class ChatGPT:
             user (str): 使用者身份標識。
             image_path (str, optional): 圖片的路徑，如果有的話。
             system_message (str): 需要傳遞給模型的系統訊息。
+            delta (bool): 為True時輸出增量的StreamEvent，否則輸出累積的完整字串。
+        """
+        return iter_sync(self.aget_response(question, max_tokens, user, image_path, system_message, delta))
+
+    def aget_response(self, question, max_tokens, user, image_path=None, system_message="", delta=False):
+        """根據提問得到GPT的回答，回傳非同步產生器。
+
+        Args:
+            question (str): 用戶的提問。
+            max_tokens (int): 最大 token 數。
+            user (str): 使用者身份標識。
+            image_path (str, optional): 圖片的路徑，如果有的話。
+            system_message (str): 需要傳遞給模型的系統訊息。
+            delta (bool): 為True時輸出增量的StreamEvent，否則輸出累積的完整字串。
         """
         if system_message:
             if self.messages == []:
@@ -236,23 +726,26 @@ class ChatGPT:
             else:
                 self.messages[0] = {"role": "system", "content": system_message}
         if self.model_config["model_name"] == "GPT-4 Vision":
-            return self._handle_vision_model(question, max_tokens, image_path, user)
+            events = self._astream_vision_model(question, max_tokens, image_path, user)
         else:
-            return self._handle_default_model(question, max_tokens, image_path, user)
+            events = self._astream_default_model(question, max_tokens, image_path, user)
+        return events if delta else aaccumulate(events)
         
-    def _get_base64_from_image(self, image_path):
-        """將圖片轉換為base64編碼。
+    def assistant_stream_output(self, prompt, file, use_model, sys_message):
+        """從助理進行串流輸出，為 aassistant_stream_output 的同步版本。
 
         Args:
-            image_path (str): 圖片的檔案路徑。
-
-        Returns:
-            str: 圖片的base64編碼字符串。
-        """
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+            prompt (str): 輸入提示給助理。
+            file (list): 包含文件ID的列表。
+            use_model (str): 使用的模型。
+            sys_message (str): 系統訊息。
         
-    def assistant_stream_output(self, prompt, file, use_model, sys_message):
+        Yields:
+            tuple: 包含輸出文本、文件ID、文件類型和文件路徑的元組。
+        """
+        return iter_sync(self.aassistant_stream_output(prompt, file, use_model, sys_message))
+
+    async def aassistant_stream_output(self, prompt, file, use_model, sys_message):
         """從助理進行串流輸出。
 
         Args:
@@ -264,70 +757,127 @@ class ChatGPT:
         Yields:
             tuple: 包含輸出文本、文件ID、文件類型和文件路徑的元組。
         """
-        try:
-            # 若模型變化，則重新創建助理
-            if use_model != self.use_model:
-                self.create_assistant(use_model)
-
-            # 創建消息和運行流
-            message = self.client.beta.threads.messages.create(
-                thread_id=self.thread.id,
-                role="user",
-                content=prompt,
-                file_ids=file
-            )
-            stream = self.client.beta.threads.runs.create(
-                thread_id=self.thread.id,
-                assistant_id=self.assistant.id,
-                instructions=sys_message,
-                stream=True,
-            )
+        with RequestTracker(self.model_config[use_model], tab=self.model_config["model_name"]) as tracker:
+            stream = None
+            run = None  # 執行中的 (客戶端, 線程ID, run ID)，被中斷時用來取消 run
+            try:
+                if self.pending_cancel is not None:
+                    # 上一次被中斷的 run 取消完成前，線程無法加入新的訊息
+                    await asyncio.shield(self.pending_cancel)
+                    self.pending_cancel = None
+                # 若模型變化，則切換到該模型已建立的助理
+                if use_model != self.use_model or self.thread is None:
+                    await asyncio.to_thread(self.select_model, use_model)
+                self.last_turn = []
+                self.transcript.append({"role": "user", "content": prompt})
+                reply = []
+                client = client_registry.get_async_for(self.model_config[self.use_model])
+                tracker.prompt(self.context.count({"role": "user", "content": prompt}))
+                waited = time.monotonic()
+                async for _ in self._admit(self.model_config[self.use_model], self.context.count({"role": "user", "content": prompt})):
+                    pass
+                tracker.queued(time.monotonic() - waited)
 
-            # 處理事件流
-            file_type = None
-            file_path = None
-            file_id = None
-            for event in stream:
-                if event.event == "thread.run.step.created":
-                    details = event.data.step_details
-                    if details.type == "tool_calls":
-                        # print("Generating code to interpret:\n\n```py")
-                        yield "Generating code to interpret:\n\n```py", file_id, file_type, file_path
-                elif event.event == "thread.message.created":
-                    # print("\nResponse:\n")
-                    yield "\nResponse:\n", file_id, file_type, file_path
-                elif event.event == "thread.message.delta":
-                    if event.data.delta.content[0].type == 'text':
-                        if event.data.delta.content[0].text.value:
-                            # print(event.data.delta.content[0].text.value, end="", flush=True)
-                            yield event.data.delta.content[0].text.value, file_id, file_type, file_path
-                        elif event.data.delta.content[0].text.annotations:
-                            # print(event.data.delta.content[0].text.annotations[0].file_path.file_id, event.data.delta.content[0].text.annotations[0].type)
-                            yield None, event.data.delta.content[0].text.annotations[0].file_path.file_id, event.data.delta.content[0].text.annotations[0].type, file_path
-                    elif event.data.delta.content[0].type == 'image_file':
-                        # print("image", event.data.delta.content[0].image_file.file_id)
-                        file_type = "image"
-                        yield None, event.data.delta.content[0].image_file.file_id, file_type, file_path
-                elif event.event == "thread.run.step.completed":
-                    details = event.data.step_details
-                    if details.type == "tool_calls":
-                        for tool in details.tool_calls:
-                            if tool.type == "code_interpreter":
-                                # print("\n```\nExecuting code...")
-                                yield "\n```\nExecuting code...", file_id, file_type, file_path
-                elif event.event == "thread.run.step.delta":
-                    details = event.data.delta.step_details
-                    if details is not None and details.type == "tool_calls":
-                        for tool in details.tool_calls or []:
-                            if tool.type == "code_interpreter" and tool.code_interpreter and tool.code_interpreter.input:
-                                # print(tool.code_interpreter.input, end="", flush=True)
-                                yield tool.code_interpreter.input, file_id, file_type, file_path
-                            elif tool.type == "code_interpreter" and tool.code_interpreter and tool.code_interpreter.outputs and tool.code_interpreter.outputs[0].type == "image":
-                                # print(tool.code_interpreter.outputs[0].type, tool.code_interpreter.outputs[0].image.file_id)
-                                yield None, tool.code_interpreter.outputs[0].image.file_id, tool.code_interpreter.outputs[0].type, file_path
-        except Exception as e:
-            output = f"An error occurred: {traceback.format_exc()}"
-            yield output, None, None, None
+                # 創建消息和運行流
+                message = await client.beta.threads.messages.create(
+                    thread_id=self.thread.id,
+                    role="user",
+                    content=prompt,
+                    file_ids=file
+                )
+                self._mark_seen()  # 提問已在線程中，切換資源後不需要再補上
+                stream = await client.beta.threads.runs.create(
+                    thread_id=self.thread.id,
+                    assistant_id=self.assistant.id,
+                    instructions=sys_message,
+                    stream=True,
+                )
+
+                # 處理事件流
+                file_type = None
+                file_path = None
+                file_id = None
+                async for event in stream:
+                    if event.event == "thread.run.created":
+                        run = (client, event.data.thread_id, event.data.id)
+                    elif event.event in ("thread.run.completed", "thread.run.failed", "thread.run.cancelled", "thread.run.expired"):
+                        run = None
+                    if event.event == "thread.run.step.created":
+                        details = event.data.step_details
+                        if details.type == "tool_calls":
+                            # print("Generating code to interpret:\n\n```py")
+                            yield "Generating code to interpret:\n\n```py", file_id, file_type, file_path
+                    elif event.event == "thread.message.created":
+                        # print("\nResponse:\n")
+                        yield "\nResponse:\n", file_id, file_type, file_path
+                    elif event.event == "thread.message.delta":
+                        if event.data.delta.content[0].type == 'text':
+                            if event.data.delta.content[0].text.value:
+                                # print(event.data.delta.content[0].text.value, end="", flush=True)
+                                reply.append(event.data.delta.content[0].text.value)
+                                tracker.token()
+                                yield event.data.delta.content[0].text.value, file_id, file_type, file_path
+                            elif event.data.delta.content[0].text.annotations:
+                                # print(event.data.delta.content[0].text.annotations[0].file_path.file_id, event.data.delta.content[0].text.annotations[0].type)
+                                yield None, event.data.delta.content[0].text.annotations[0].file_path.file_id, event.data.delta.content[0].text.annotations[0].type, file_path
+                        elif event.data.delta.content[0].type == 'image_file':
+                            # print("image", event.data.delta.content[0].image_file.file_id)
+                            file_type = "image"
+                            yield None, event.data.delta.content[0].image_file.file_id, file_type, file_path
+                    elif event.event == "thread.run.step.completed":
+                        details = event.data.step_details
+                        if details.type == "tool_calls":
+                            for tool in details.tool_calls:
+                                if tool.type == "code_interpreter":
+                                    # print("\n```\nExecuting code...")
+                                    yield "\n```\nExecuting code...", file_id, file_type, file_path
+                    elif event.event == "thread.run.step.delta":
+                        details = event.data.delta.step_details
+                        if details is not None and details.type == "tool_calls":
+                            for tool in details.tool_calls or []:
+                                if tool.type == "code_interpreter" and tool.code_interpreter and tool.code_interpreter.input:
+                                    # print(tool.code_interpreter.input, end="", flush=True)
+                                    tracker.token()
+                                    yield tool.code_interpreter.input, file_id, file_type, file_path
+                                elif tool.type == "code_interpreter" and tool.code_interpreter and tool.code_interpreter.outputs and tool.code_interpreter.outputs[0].type == "image":
+                                    # print(tool.code_interpreter.outputs[0].type, tool.code_interpreter.outputs[0].image.file_id)
+                                    yield None, tool.code_interpreter.outputs[0].image.file_id, tool.code_interpreter.outputs[0].type, file_path
+                    elif event.event == "thread.run.completed" and event.data.usage:
+                        tracker.usage(event.data.usage.prompt_tokens, event.data.usage.completion_tokens)
+                self.transcript.append({"role": "assistant", "content": "".join(reply)})
+                self.transcript = self.transcript[-self.max_transcript:]
+                self.last_turn = self.transcript[-2:]
+                self._mark_seen()
+            except Exception as e:
+                if _is_rate_limited(e):
+                    tracker.rate_limited()
+                tracker.fail("quota_exceeded" if isinstance(e, QuotaExceeded) else "error")
+                output = f"An error occurred: {traceback.format_exc()}"
+                yield output, None, None, None
+            finally:
+                if stream is not None:
+                    await _aclose(stream)
+                if run is not None:
+                    # 在背景取消 run，停止消耗token且不延遲串流的結束
+                    self.pending_cancel = asyncio.ensure_future(self._cancel_run(*run))
+
+    async def _cancel_run(self, client, thread_id, run_id, timeout=10):
+        """取消仍在執行的 run，並等待其停止，讓線程可以接受下一則訊息。
+
+        Args:
+            client (AsyncAzureOpenAI): run 所屬資源的非同步客戶端。
+            thread_id (str): 線程ID。
+            run_id (str): run ID。
+            timeout (float): 等待 run 停止的秒數上限。
+        """
+        try:
+            run = await client.beta.threads.runs.cancel(run_id, thread_id=thread_id)
+            deadline = time.monotonic() + timeout
+            while run.status in ("queued", "in_progress", "requires_action", "cancelling") and time.monotonic() < deadline:
+                await asyncio.sleep(0.5)
+                run = await client.beta.threads.runs.retrieve(run_id, thread_id=thread_id)
+        except Exception:
+            pass  # run 可能已經結束，下一則訊息送出時若仍失敗會回報錯誤
 
 
     def show_output(self, prompt):
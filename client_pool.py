@@ -0,0 +1,177 @@
+import asyncio
+import threading
+import weakref
+
+import httpx
+from openai import AsyncAzureOpenAI, AzureOpenAI
+
+try:
+    import h2  # noqa: F401  HTTP/2 需要額外安裝 h2 套件
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class ClientRegistry:
+    def __init__(self, max_connections=100, max_keepalive_connections=20, keepalive_expiry=120, timeout=600, http2=True):
+        """全域共用的 Azure OpenAI 客戶端註冊表，相同的端點與部署會重複使用同一個長連線客戶端。
+
+        Args:
+            max_connections (int): 每個客戶端連線池的最大連線數。
+            max_keepalive_connections (int): 連線池保留的閒置連線數。
+            keepalive_expiry (float): 閒置連線保留的秒數。
+            timeout (float): 請求逾時秒數。
+            http2 (bool): 是否啟用HTTP/2，需安裝 h2 套件才會生效。
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = timeout
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._clients = {}
+        self._async_clients = weakref.WeakKeyDictionary()  # 非同步連線池綁定在事件迴圈上，依迴圈分開保存
+        self._warmed = weakref.WeakKeyDictionary()  # 各事件迴圈已預熱的客戶端
+        self._lock = threading.Lock()
+
+    def get(self, endpoint, api_version, key, deployment=None):
+        """取得（或建立）指定端點的客戶端。
+
+        Args:
+            endpoint (str): Azure OpenAI 端點。
+            api_version (str): API 版本。
+            key (str): API 金鑰。
+            deployment (str, optional): 指定時以該部署的URL作為 base_url，否則以端點建立客戶端。
+
+        Returns:
+            AzureOpenAI: 共用的客戶端。
+        """
+        cache_key = (endpoint, api_version, deployment, key)
+        client = self._clients.get(cache_key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(cache_key)
+            if client is None:
+                http_client = httpx.Client(limits=self.limits, timeout=self.timeout, http2=self.http2)
+                if deployment:
+                    client = AzureOpenAI(
+                        api_key=key,
+                        api_version=api_version,
+                        base_url=endpoint.rstrip("/")+"/openai/deployments/"+deployment,
+                        http_client=http_client
+                    )
+                else:
+                    client = AzureOpenAI(
+                        api_key=key,
+                        api_version=api_version,
+                        azure_endpoint=endpoint,
+                        http_client=http_client
+                    )
+                self._clients[cache_key] = client
+        return client
+
+    def get_async(self, endpoint, api_version, key, deployment=None):
+        """取得（或建立）目前事件迴圈中指定端點的非同步客戶端。
+
+        Args:
+            endpoint (str): Azure OpenAI 端點。
+            api_version (str): API 版本。
+            key (str): API 金鑰。
+            deployment (str, optional): 指定時以該部署的URL作為 base_url，否則以端點建立客戶端。
+
+        Returns:
+            AsyncAzureOpenAI: 共用的非同步客戶端。
+        """
+        loop = asyncio.get_running_loop()
+        cache_key = (endpoint, api_version, deployment, key)
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(cache_key)
+            if client is None:
+                http_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=self.http2)
+                if deployment:
+                    client = AsyncAzureOpenAI(
+                        api_key=key,
+                        api_version=api_version,
+                        base_url=endpoint.rstrip("/")+"/openai/deployments/"+deployment,
+                        http_client=http_client
+                    )
+                else:
+                    client = AsyncAzureOpenAI(
+                        api_key=key,
+                        api_version=api_version,
+                        azure_endpoint=endpoint,
+                        http_client=http_client
+                    )
+                clients[cache_key] = client
+        return client
+
+    def get_async_for(self, config, per_deployment=False):
+        """依模型配置取得目前事件迴圈的非同步客戶端。
+
+        Args:
+            config (dict): 含有 endpoint、api-version、key 與 deployment 的模型配置。
+            per_deployment (bool): 是否以部署URL作為 base_url。
+
+        Returns:
+            AsyncAzureOpenAI: 共用的非同步客戶端。
+        """
+        return self.get_async(
+            config["endpoint"],
+            config["api-version"],
+            config["key"],
+            config["deployment"] if per_deployment else None
+        )
+
+    def get_for(self, config, per_deployment=False):
+        """依模型配置取得客戶端。
+
+        Args:
+            config (dict): 含有 endpoint、api-version、key 與 deployment 的模型配置。
+            per_deployment (bool): 是否以部署URL作為 base_url。
+
+        Returns:
+            AzureOpenAI: 共用的客戶端。
+        """
+        return self.get(
+            config["endpoint"],
+            config["api-version"],
+            config["key"],
+            config["deployment"] if per_deployment else None
+        )
+
+    async def warm_up(self, model_list):
+        """在目前的事件迴圈預先建立所有部署的非同步客戶端並建立TLS連線，之後的請求不需等待連線建立。
+
+        包含以端點與以部署URL建立的客戶端，已在此事件迴圈預熱過的客戶端會略過。
+
+        Args:
+            model_list (list): model_config.json 的內容。
+        """
+        loop = asyncio.get_running_loop()
+        targets = []
+        for config in model_list:
+            # Assistants 的配置包含多個模型的子配置，多區域的模型則包含各區域的端點
+            configs = [config] + [value for value in config.values() if isinstance(value, dict)]
+            configs += [{**config, **endpoint} for endpoint in config.get("endpoints", [])]
+            for item in configs:
+                if item.get("endpoint") and item.get("key") and item.get("api-version") and item.get("deployment"):
+                    for per_deployment in (False, True):
+                        targets.append((item["endpoint"], self.get_async_for(item, per_deployment)))
+        with self._lock:
+            warmed = self._warmed.setdefault(loop, set())
+            targets = [(endpoint, client) for endpoint, client in targets if id(client) not in warmed]
+            warmed.update(id(client) for _, client in targets)
+
+        async def _connect(endpoint, client):
+            try:
+                await client._client.head(endpoint)  # 僅為建立連線，回應內容不重要
+            except Exception:
+                pass
+
+        await asyncio.gather(*(_connect(endpoint, client) for endpoint, client in targets))
+
+
+client_registry = ClientRegistry()
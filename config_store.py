@@ -0,0 +1,166 @@
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+
+
+class ConfigStore:
+    def __init__(self, path='user_config.json', write_delay=0.5, poll_interval=2.0):
+        """user_config.json 的記憶體存放區，讀取不經過磁碟，修改會合併後延遲寫回。
+
+        Args:
+            path (str): 用戶配置檔案的路徑。
+            write_delay (float): 修改後延遲寫回檔案的秒數，期間的多次修改只寫入一次。
+            poll_interval (float): 檢查檔案是否被外部修改的間隔秒數。
+        """
+        self.path = path
+        self.write_delay = write_delay
+        self.poll_interval = poll_interval
+        self._lock = threading.RLock()
+        self._timer = None
+        self._watcher = None
+        self._listeners = []
+        self.load()
+        atexit.register(self.flush)
+
+    def load(self):
+        """從檔案重新讀取配置。"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        with self._lock:
+            self._passwords = data[0]
+            self._messages = data[1]
+            self._mtime = os.stat(self.path).st_mtime_ns
+            self._dirty = False  # 是否有尚未寫回檔案的修改
+
+    def reload(self):
+        """檔案在磁碟上有變更且沒有未寫回的修改時重新讀取。
+
+        Returns:
+            bool: 是否重新讀取了配置。
+        """
+        with self._lock:
+            if self._dirty or os.stat(self.path).st_mtime_ns == self._mtime:
+                return False
+            self.load()
+            return True
+
+    def check_password(self, username, password):
+        """確認帳號與密碼是否正確。"""
+        return self._passwords.get(username) == password
+
+    def has_user(self, username):
+        """確認用戶是否存在於配置中。"""
+        return username in self._passwords
+
+    def system_messages(self, username):
+        """取得用戶系統訊息的副本。
+
+        Args:
+            username (str): 用戶名。
+
+        Returns:
+            dict: 系統訊息名稱與內容的字典。
+        """
+        with self._lock:
+            return dict(self._messages[username])
+
+    def snapshot(self):
+        """取得整份配置的副本。
+
+        Returns:
+            list: 與 user_config.json 相同結構的配置。
+        """
+        with self._lock:
+            return copy.deepcopy([self._passwords, self._messages])
+
+    def set_system_message(self, username, name, content):
+        """新增或更新用戶的系統訊息並排程寫回檔案。
+
+        Args:
+            username (str): 用戶名。
+            name (str): 系統訊息名稱。
+            content (str): 系統訊息內容。
+
+        Returns:
+            dict: 更新後系統訊息的副本。
+        """
+        with self._lock:
+            self._messages.setdefault(username, {})[name] = content
+            self._dirty = True
+            self._schedule_write()
+            return dict(self._messages[username])
+
+    def delete_system_message(self, username, name):
+        """刪除用戶的系統訊息並排程寫回檔案。
+
+        Args:
+            username (str): 用戶名。
+            name (str): 系統訊息名稱。
+
+        Returns:
+            dict: 更新後系統訊息的副本。
+        """
+        with self._lock:
+            self._messages[username].pop(name, None)
+            self._dirty = True
+            self._schedule_write()
+            return dict(self._messages[username])
+
+    def _schedule_write(self):
+        """延遲寫回檔案，短時間內的多次修改只會寫入一次。"""
+        if self._timer is None:
+            self._timer = threading.Timer(self.write_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """立即將尚未寫回的修改寫入檔案，先寫入暫存檔再以原子性的方式取代原檔案。
+
+        沒有修改時不會寫入，只讀取配置的程序結束時不會以舊的內容覆蓋檔案。
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            data = json.dumps([self._passwords, self._messages], ensure_ascii=False, indent=4)
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+            self._dirty = False
+
+    def on_reload(self, callback):
+        """註冊檔案被外部修改並重新讀取後要呼叫的函式。
+
+        Args:
+            callback (callable): 不需要參數的函式。
+        """
+        self._listeners.append(callback)
+
+    def start_watcher(self):
+        """啟動背景執行緒，檔案在磁碟上被修改時自動重新讀取。"""
+        if self._watcher is not None:
+            return
+
+        def _watch():
+            while True:
+                time.sleep(self.poll_interval)
+                try:
+                    # 沒有變更，或尚有未寫回的修改時以記憶體中的內容為準
+                    if not self.reload():
+                        continue
+                except (OSError, ValueError):
+                    continue  # 檔案正在被編輯或格式錯誤時等待下一次檢查
+                for callback in self._listeners:
+                    callback()
+
+        self._watcher = threading.Thread(target=_watch, name="config-watcher", daemon=True)
+        self._watcher.start()
@@ -0,0 +1,125 @@
+from collections import OrderedDict
+import threading
+
+try:
+    import tiktoken  # litellm 的依賴套件，未安裝時改用估算
+except ImportError:
+    tiktoken = None
+
+
+class ContextWindow:
+    def __init__(self, max_tokens=8192, pinned_turns=0, image_tokens=765, encoding="cl100k_base", cache_size=4096):
+        """以token預算控制送出給模型的對話內容，超過預算時刪除較舊的對話。
+
+        Args:
+            max_tokens (int): 部署的最大上下文token數，包含回應的token。
+            pinned_turns (int): 系統訊息之後固定保留的最早訊息數量。
+            image_tokens (int): 每張圖片估算的token數。
+            encoding (str): tiktoken 的編碼名稱。
+            cache_size (int): 快取訊息token數的數量上限。
+        """
+        self.max_tokens = max_tokens
+        self.pinned_turns = pinned_turns
+        self.image_tokens = image_tokens
+        self.encoder = tiktoken.get_encoding(encoding) if tiktoken else None
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, model_config):
+        """依 model_config.json 中的 context_window 欄位建立。
+
+        Args:
+            model_config (dict): 模型配置。
+
+        Returns:
+            ContextWindow: 對應的上下文管理器。
+        """
+        return cls(**model_config.get("context_window", {}))
+
+    def _count_text(self, text):
+        """計算一段文字的token數，結果會快取以免重複計算。"""
+        with self._lock:
+            count = self._cache.get(text)
+            if count is not None:
+                self._cache.move_to_end(text)
+                return count
+        if self.encoder:
+            count = len(self.encoder.encode(text, disallowed_special=()))
+        else:
+            # 沒有 tiktoken 時以字元估算：中日韓文字約一字一token，其餘約四字元一token
+            wide = sum(1 for char in text if ord(char) > 0x2E80)
+            count = wide + (len(text) - wide + 3) // 4
+        with self._lock:
+            self._cache[text] = count
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return count
+
+    def count(self, message):
+        """計算單一訊息的token數。
+
+        Args:
+            message (dict): 包含 role 與 content 的訊息。
+
+        Returns:
+            int: 訊息的token數。
+        """
+        content = message["content"]
+        tokens = 3  # 每則訊息的格式開銷
+        if isinstance(content, str):
+            return tokens + self._count_text(content)
+        for part in content:
+            if part.get("type") == "text":
+                tokens += self._count_text(part["text"])
+            else:
+                tokens += self.image_tokens
+        return tokens
+
+    def total(self, messages):
+        """計算整個訊息列表的token數。
+
+        Args:
+            messages (list): 訊息列表。
+
+        Returns:
+            int: 訊息列表的token數。
+        """
+        return 3 + sum(self.count(message) for message in messages)
+
+    def fit(self, messages, completion_tokens=0):
+        """刪除較舊的對話，使訊息列表加上回應的token不超過預算。系統訊息與固定的訊息一律保留。
+
+        Args:
+            messages (list): 訊息列表。
+            completion_tokens (int): 保留給回應的token數。
+
+        Returns:
+            list: 符合預算的訊息列表。
+        """
+        if not messages:
+            return messages
+        budget = self.max_tokens - completion_tokens - 3
+        head = []
+        if messages[0]["role"] == "system":
+            head.append(messages[0])
+        head += messages[len(head):len(head)+self.pinned_turns]
+        rest = messages[len(head):]
+        budget -= sum(self.count(message) for message in head)
+
+        kept = []
+        for message in reversed(rest):
+            tokens = self.count(message)
+            # 最新的一則訊息即使超過預算也必須送出
+            if kept and tokens > budget:
+                break
+            kept.append(message)
+            budget -= tokens
+        kept.reverse()
+        # 避免保留的對話以模型的回答開頭
+        while len(kept) > 1 and kept[0]["role"] == "assistant":
+            kept.pop(0)
+        if len(kept) == len(rest):
+            return messages
+        return head + kept
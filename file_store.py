@@ -0,0 +1,232 @@
+import asyncio
+from collections import OrderedDict
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+
+class StorageQuotaExceeded(Exception):
+    """單一檔案超過使用者的儲存空間上限時拋出。"""
+
+
+class FileStore:
+    def __init__(self, root="cache/files", quota_bytes=200 * 1024 * 1024, ttl=86400, sweep_interval=600, chunk_size=65536):
+        """Assistants 輸出檔案的下載與保存，每位使用者有獨立的資料夾與容量上限。
+
+        檔案以串流方式分塊寫入磁碟，同一個 file_id 只會下載一次，超過保存時間的檔案由背景執行緒刪除。
+
+        Args:
+            root (str): 保存檔案的根資料夾。
+            quota_bytes (int): 每位使用者可使用的磁碟空間，超過時先刪除最舊的檔案。
+            ttl (float): 檔案保存的秒數。
+            sweep_interval (float): 背景清理過期檔案的間隔秒數。
+            chunk_size (int): 下載時每次寫入的位元組數。
+        """
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.chunk_size = chunk_size
+        self._pending = {}  # 下載中的 (用戶名, file_id) 與對應的 Task，讓重複的請求等待同一次下載
+        self._sweeper = None
+        os.makedirs(root, exist_ok=True)
+
+    def _user_dir(self, username):
+        return os.path.join(self.root, username)
+
+    def _existing(self, username, file_id):
+        """回傳已下載的檔案路徑，沒有時回傳None。"""
+        directory = os.path.join(self._user_dir(username), file_id)
+        try:
+            names = [name for name in os.listdir(directory) if not name.endswith(".part")]
+        except OSError:
+            return None
+        return os.path.join(directory, names[0]) if names else None
+
+    async def fetch(self, username, client, file_id, file_type=None):
+        """下載 Assistants 產生的檔案，已下載或正在下載的檔案不會重複傳輸。
+
+        Args:
+            username (str): 用戶名。
+            client (AsyncAzureOpenAI): 檔案所屬資源的非同步客戶端。
+            file_id (str): 檔案ID。
+            file_type (str, optional): "image" 表示圖片，其餘會查詢原始檔名。
+
+        Returns:
+            str: 檔案在磁碟上的路徑。
+
+        Raises:
+            StorageQuotaExceeded: 檔案本身超過使用者的容量上限。
+        """
+        path = self._existing(username, file_id)
+        if path is not None:
+            return path
+        key = (username, file_id)
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._download(username, client, file_id, file_type))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)  # 其中一個等待者被取消時不影響其他人
+
+    async def _download(self, username, client, file_id, file_type):
+        if file_type == "image":
+            filename = file_id + ".png"
+        else:
+            file_object = await client.files.retrieve(file_id)
+            filename = os.path.basename(file_object.filename) or file_id
+        directory = os.path.join(self._user_dir(username), file_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, filename)
+        temp_path = path + ".part"
+        size = 0
+        try:
+            async with client.files.with_streaming_response.content(file_id) as response:
+                with open(temp_path, "wb") as f:
+                    async for chunk in response.iter_bytes(self.chunk_size):
+                        size += len(chunk)
+                        if size > self.quota_bytes:
+                            raise StorageQuotaExceeded(f"The file is larger than the {self.quota_bytes // (1024 * 1024)} MB storage limit.")
+                        f.write(chunk)
+            os.replace(temp_path, path)
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        await asyncio.to_thread(self.enforce_quota, username, keep=path)
+        return path
+
+    def usage(self, username):
+        """統計使用者目前的檔案。
+
+        Args:
+            username (str): 用戶名。
+
+        Returns:
+            list: 依修改時間由舊到新排列的 (修改時間, 大小, 路徑)。
+        """
+        files = []
+        for directory, _, names in os.walk(self._user_dir(username)):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        return files
+
+    def _remove(self, path):
+        """刪除檔案與其 file_id 資料夾。"""
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    def enforce_quota(self, username, keep=None):
+        """使用者的檔案超過容量上限時，從最舊的檔案開始刪除。
+
+        Args:
+            username (str): 用戶名。
+            keep (str, optional): 不可刪除的檔案路徑，通常是剛下載的檔案。
+        """
+        files = self.usage(username)
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.quota_bytes:
+                break
+            if path == keep or path.endswith(".part"):
+                continue
+            self._remove(path)
+            total -= size
+
+    def sweep(self):
+        """刪除所有使用者超過保存時間的檔案。
+
+        Returns:
+            int: 刪除的檔案數量。
+        """
+        deadline = time.time() - self.ttl
+        removed = 0
+        try:
+            usernames = os.listdir(self.root)
+        except OSError:
+            return 0
+        for username in usernames:
+            for mtime, _, path in self.usage(username):
+                if mtime < deadline and not path.endswith(".part"):
+                    self._remove(path)
+                    removed += 1
+        return removed
+
+    def start_sweeper(self):
+        """啟動背景執行緒定期刪除過期的檔案。"""
+        if self._sweeper is not None:
+            return
+
+        def _sweep():
+            while True:
+                time.sleep(self.sweep_interval)
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=_sweep, name="file-sweeper", daemon=True)
+        self._sweeper.start()
+
+
+class UploadCache:
+    def __init__(self, max_entries=1000, chunk_size=1024 * 1024):
+        """以檔案內容雜湊記錄已上傳至 Assistants 的 file_id，相同的檔案不會重複上傳。
+
+        Args:
+            max_entries (int): 記錄的檔案數量上限，超過時移除最久未使用的記錄。
+            chunk_size (int): 計算雜湊時每次讀取的位元組數。
+        """
+        self.max_entries = max_entries
+        self.chunk_size = chunk_size
+        self._file_ids = OrderedDict()
+        self._pending = {}  # 上傳中的檔案與對應的 Task，讓同時上傳的相同檔案只傳輸一次
+        self._lock = threading.Lock()
+
+    def _digest(self, path):
+        """分塊讀取檔案計算雜湊，不會將整個檔案讀入記憶體。"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    async def upload(self, client, config, path):
+        """上傳檔案並回傳 file_id，同一資源已上傳過的相同內容直接回傳先前的 file_id。
+
+        Args:
+            client (AsyncAzureOpenAI): 檔案所屬資源的非同步客戶端。
+            config (dict): 含有 endpoint 的模型配置，檔案在同一資源的部署之間共用。
+            path (str): 檔案的路徑。
+
+        Returns:
+            str: 檔案ID。
+        """
+        key = (config["endpoint"], await asyncio.to_thread(self._digest, path))
+        with self._lock:
+            file_id = self._file_ids.get(key)
+            if file_id is not None:
+                self._file_ids.move_to_end(key)
+                return file_id
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._upload(client, key, path))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _upload(self, client, key, path):
+        with open(path, "rb") as f:  # 由 httpx 分塊讀取檔案傳送
+            file_object = await client.files.create(file=(os.path.basename(path), f), purpose="assistants")
+        with self._lock:
+            self._file_ids[key] = file_object.id
+            while len(self._file_ids) > self.max_entries:
+                self._file_ids.popitem(last=False)
+        return file_object.id
+
+
+file_store = FileStore()
+upload_cache = UploadCache()
@@ -0,0 +1,241 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+
+import httpx
+from PIL import Image
+
+
+class ImageStore:
+    def __init__(self, cache_dir="cache/images", thumbnail_size=256, max_workers=2, chunk_size=65536,
+                 max_bytes=1024 * 1024 * 1024, ttl=30 * 86400, sweep_interval=600):
+        """以內容雜湊保存生成圖片的磁碟快取，圖片邊下載邊寫入，縮圖在背景執行緒產生。
+
+        相同的部署、提示、尺寸、風格與品質組合會直接使用已保存的圖片，不會重新生成。
+        超過保存時間的圖片，以及超過容量上限時最久未使用的圖片，由背景執行緒刪除。
+
+        Args:
+            cache_dir (str): 圖片快取的資料夾。
+            thumbnail_size (int): 縮圖長邊的像素。
+            max_workers (int): 同時產生縮圖的執行緒數。
+            chunk_size (int): 下載時每次寫入的位元組數。
+            max_bytes (int): 圖片與縮圖合計的磁碟空間上限。
+            ttl (float): 圖片在最後一次使用後保存的秒數。
+            sweep_interval (float): 背景清理的間隔秒數。
+        """
+        self.cache_dir = cache_dir
+        self.thumbnail_size = thumbnail_size
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-thumbnail")
+        self._http_clients = weakref.WeakKeyDictionary()  # 非同步連線池綁定在事件迴圈上，依迴圈分開保存
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "prompts"), exist_ok=True)
+
+    @staticmethod
+    def make_key(deployment, prompt, size, style, quality, variant=0):
+        """以生成參數產生快取的鍵。
+
+        Args:
+            deployment (str): 部署名稱。
+            prompt (str): 圖像生成的提示語。
+            size (str): 圖像尺寸。
+            style (str): 圖像風格。
+            quality (str): 圖像質量。
+            variant (int): 同一組參數的第幾張變化圖。
+
+        Returns:
+            str: 快取的鍵。
+        """
+        payload = json.dumps([deployment, " ".join(prompt.split()), size, style, quality, variant], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _prompt_path(self, key):
+        return os.path.join(self.cache_dir, "prompts", key + ".json")
+
+    def lookup(self, key):
+        """取得已保存的生成結果。
+
+        Args:
+            key (str): make_key 產生的鍵。
+
+        Returns:
+            dict: 包含 revised_prompt、path 與 thumbnail 的字典，沒有或檔案已被刪除時回傳None。
+        """
+        try:
+            with open(self._prompt_path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(entry["path"])  # 更新使用時間，清理時優先刪除最久未使用的圖片
+        except OSError:
+            return None
+        return entry
+
+    def remember(self, key, revised_prompt, path, thumbnail):
+        """保存生成參數與圖片檔案的對應。"""
+        temp_path = f"{self._prompt_path(key)}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"revised_prompt": revised_prompt, "path": path, "thumbnail": thumbnail}, f, ensure_ascii=False)
+        os.replace(temp_path, self._prompt_path(key))
+
+    def _http_client(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._http_clients.get(loop)
+            if client is None:
+                client = httpx.AsyncClient(timeout=120, follow_redirects=True)
+                self._http_clients[loop] = client
+        return client
+
+    async def download(self, url):
+        """以串流方式下載圖片，邊接收邊寫入暫存檔並計算雜湊，完成後以雜湊命名。
+
+        Args:
+            url (str): 圖片的URL。
+
+        Returns:
+            str: 圖片的檔案路徑。
+        """
+        digest = hashlib.sha256()
+        temp_path = os.path.join(self.cache_dir, f"download.{id(asyncio.current_task())}.tmp")
+        try:
+            async with self._http_client().stream("GET", url) as response:
+                response.raise_for_status()
+                extension = response.headers.get("content-type", "image/png").split("/")[-1].split(";")[0]
+                with open(temp_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(self.chunk_size):
+                        digest.update(chunk)
+                        f.write(chunk)
+            name = digest.hexdigest()
+            directory = os.path.join(self.cache_dir, name[:2])
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{name}.{extension}")
+            os.replace(temp_path, path)  # 相同內容的圖片只會保留一份
+            return path
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def _thumbnail_path(path):
+        return os.path.splitext(path)[0] + ".thumb.webp"
+
+    def _thumbnail(self, path):
+        """產生圖片的縮圖，已存在時直接回傳。"""
+        thumbnail_path = self._thumbnail_path(path)
+        if not os.path.exists(thumbnail_path):
+            with Image.open(path) as image:
+                image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+                image.save(thumbnail_path, format="WEBP", quality=80)
+        return thumbnail_path
+
+    async def thumbnail(self, path):
+        """在背景執行緒產生縮圖，不佔用事件迴圈。
+
+        Args:
+            path (str): 圖片的檔案路徑。
+
+        Returns:
+            str: 縮圖的檔案路徑。
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._thumbnail, path)
+
+    def usage(self):
+        """統計快取中的圖片，原圖與縮圖合計為一筆。
+
+        Returns:
+            list: 依使用時間由舊到新排列的 (使用時間, 大小, 原圖路徑)。
+        """
+        images = []
+        for name in os.listdir(self.cache_dir):
+            directory = os.path.join(self.cache_dir, name)
+            if name == "prompts" or not os.path.isdir(directory):
+                continue
+            for filename in os.listdir(directory):
+                if ".thumb." in filename:
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                size = stat.st_size
+                try:
+                    size += os.path.getsize(self._thumbnail_path(path))
+                except OSError:
+                    pass
+                images.append((stat.st_mtime, size, path))
+        images.sort()
+        return images
+
+    def _remove(self, path):
+        """刪除原圖與其縮圖。"""
+        for target in (path, self._thumbnail_path(path)):
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+
+    def _prune_prompts(self):
+        """刪除圖片已不存在的生成參數紀錄。"""
+        directory = os.path.join(self.cache_dir, "prompts")
+        for name in os.listdir(directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    image_path = json.load(f)["path"]
+            except (OSError, ValueError, KeyError):
+                continue
+            if not os.path.exists(image_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def sweep(self):
+        """刪除超過保存時間的圖片，總容量仍超過上限時從最久未使用的圖片開始刪除。
+
+        Returns:
+            int: 刪除的圖片數量。
+        """
+        deadline = time.time() - self.ttl
+        images = self.usage()
+        total = sum(size for _, size, _ in images)
+        removed = 0
+        for mtime, size, path in images:
+            if mtime >= deadline and total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+        if removed:
+            self._prune_prompts()
+        return removed
+
+    def start_sweeper(self):
+        """啟動背景執行緒定期清理圖片快取。"""
+        if self._sweeper is not None:
+            return
+
+        def _sweep():
+            while True:
+                time.sleep(self.sweep_interval)
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=_sweep, name="image-sweeper", daemon=True)
+        self._sweeper.start()
+
+
+image_store = ImageStore()
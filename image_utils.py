@@ -0,0 +1,100 @@
+import base64
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
+import threading
+
+from PIL import Image, ImageOps
+
+
+class ImageEncoder:
+    def __init__(self, max_side=2048, short_side=768, quality=85, cache_size=256, max_workers=4):
+        """將上傳的圖片縮放並重新編碼為data URL，並以內容雜湊快取結果。
+
+        視覺模型會把圖片縮放到 2048x2048 以內且短邊不超過 768 像素，超過的解析度只會增加傳輸量。
+
+        Args:
+            max_side (int): 圖片長邊的上限像素。
+            short_side (int): 圖片短邊的上限像素。
+            quality (int): JPEG/WEBP 的壓縮品質。
+            cache_size (int): 快取的圖片數量上限。
+            max_workers (int): 同時處理圖片的執行緒數。
+        """
+        self.max_side = max_side
+        self.short_side = short_side
+        self.quality = quality
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-encoder")
+
+    def _resize(self, image):
+        """依視覺模型的有效解析度縮小圖片。"""
+        width, height = image.size
+        scale = min(1.0, self.max_side / max(width, height))  # 先限制長邊
+        scale *= min(1.0, self.short_side / (min(width, height) * scale))  # 再限制短邊
+        if scale < 1.0:
+            image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+        return image
+
+    def _encode(self, data):
+        """縮放並重新編碼圖片，有透明度的圖片以WEBP保留透明度，其餘以JPEG編碼。
+
+        Args:
+            data (bytes): 原始圖片內容。
+
+        Returns:
+            str: 圖片的data URL。
+        """
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)  # 依照EXIF方向轉正
+        image = self._resize(image)
+        buffer = io.BytesIO()
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            image.convert("RGBA").save(buffer, format="WEBP", quality=self.quality)
+            mime = "image/webp"
+        else:
+            image.convert("RGB").save(buffer, format="JPEG", quality=self.quality, optimize=True)
+            mime = "image/jpeg"
+        return f"data:{mime};base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
+
+    def encode(self, image_path):
+        """將圖片檔案轉換為data URL，相同內容的圖片直接使用快取。
+
+        Args:
+            image_path (str): 圖片的檔案路徑。
+
+        Returns:
+            str: 圖片的data URL。
+        """
+        with open(image_path, "rb") as image_file:
+            data = image_file.read()
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            url = self._cache.get(digest)
+            if url is not None:
+                self._cache.move_to_end(digest)
+                return url
+        url = self._encode(data)
+        with self._lock:
+            self._cache[digest] = url
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return url
+
+    def encode_many(self, image_paths):
+        """平行處理多張圖片。
+
+        Args:
+            image_paths (list): 圖片的檔案路徑列表。
+
+        Returns:
+            list: 與輸入順序相同的data URL列表。
+        """
+        if len(image_paths) == 1:
+            return [self.encode(image_paths[0])]
+        return list(self._executor.map(self.encode, image_paths))
+
+
+image_encoder = ImageEncoder()
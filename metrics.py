@@ -0,0 +1,273 @@
+import asyncio
+import threading
+import time
+from urllib.parse import urlparse
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=("deployment", "endpoint", "tab")):
+        """以標籤區分數值的指標，輸出為 Prometheus 文字格式。
+
+        Args:
+            name (str): 指標名稱。
+            documentation (str): 指標說明。
+            labelnames (tuple): 標籤名稱。
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self):
+        """產生 (名稱後綴, 標籤值, 額外標籤, 數值) 的樣本。"""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield "", key, (), value
+
+    def render(self):
+        """輸出此指標的 Prometheus 文字格式。"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        """增加計數。"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, amount=1, **labels):
+        """增加目前的數值。"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        """減少目前的數值。"""
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, buckets, labelnames=("deployment", "endpoint", "tab")):
+        """累計分布的指標。
+
+        Args:
+            name (str): 指標名稱。
+            documentation (str): 指標說明。
+            buckets (tuple): 各區間的上限，會自動加上 +Inf。
+            labelnames (tuple): 標籤名稱。
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        """記錄一次觀測值。"""
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total)) for key, (counts, total) in self._values.items()]
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                yield "_bucket", key, (("le", _format_value(bound)),), count
+            yield "_sum", key, (), total
+            yield "_count", key, (), counts[-1]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """集中保存所有指標並輸出 /metrics 的內容。"""
+        self._metrics = []
+
+    def register(self, metric):
+        """加入指標。
+
+        Returns:
+            Metric: 加入的指標。
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """輸出所有指標的 Prometheus 文字格式。"""
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+requests_total = registry.register(Counter(
+    "chatgpt_requests_total", "Upstream requests by result.", ("deployment", "endpoint", "tab", "status")))
+rate_limited_total = registry.register(Counter(
+    "chatgpt_rate_limited_total", "Upstream responses with HTTP 429."))
+prompt_tokens_total = registry.register(Counter(
+    "chatgpt_prompt_tokens_total", "Prompt tokens sent upstream."))
+completion_tokens_total = registry.register(Counter(
+    "chatgpt_completion_tokens_total", "Completion tokens received from upstream."))
+active_streams = registry.register(Gauge(
+    "chatgpt_active_streams", "Requests currently in progress."))
+queue_wait_seconds = registry.register(Histogram(
+    "chatgpt_queue_wait_seconds", "Time spent waiting for TPM/RPM quota.",
+    (0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120)))
+time_to_first_token_seconds = registry.register(Histogram(
+    "chatgpt_time_to_first_token_seconds", "Time from request start to the first streamed token.",
+    (0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 60)))
+request_duration_seconds = registry.register(Histogram(
+    "chatgpt_request_duration_seconds", "Total request latency.",
+    (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)))
+hedges_total = registry.register(Counter(
+    "chatgpt_hedges_total", "Hedged requests by the request that streamed first.", ("deployment", "endpoint", "tab", "winner")))
+tokens_per_second = registry.register(Histogram(
+    "chatgpt_tokens_per_second", "Completion tokens per second after the first token.",
+    (1, 5, 10, 20, 40, 60, 80, 120, 200)))
+
+
+def _deployment_labels(config):
+    """部署與端點主機名稱的標籤，同名的部署在不同區域時可以區分。"""
+    return {"deployment": config.get("deployment", ""), "endpoint": urlparse(config.get("endpoint") or "").hostname or ""}
+
+
+class RequestTracker:
+    def __init__(self, config, tab=None):
+        """記錄單一上游請求的排隊時間、首個token時間、速度與用量，以 with 包住整個請求。
+
+        Args:
+            config (dict): 部署的模型配置，請求改由其他區域處理時以 route 更新。
+            tab (str, optional): 發出請求的頁面名稱，預設為模型名稱。
+        """
+        self.labels = {**_deployment_labels(config), "tab": tab or config.get("model_name", "")}
+        self.started = None
+        self.first_token = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.usage_reported = False
+        self.status = "ok"
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        active_streams.inc(**self.labels)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        now = time.monotonic()
+        active_streams.dec(**self.labels)
+        if exc_type is not None and self.status == "ok":
+            self.status = "cancelled" if issubclass(exc_type, (GeneratorExit, asyncio.CancelledError)) else "error"
+        request_duration_seconds.observe(now - self.started, **self.labels)
+        requests_total.inc(status=self.status, **self.labels)
+        prompt_tokens_total.inc(self.prompt_tokens, **self.labels)
+        completion_tokens_total.inc(self.completion_tokens, **self.labels)
+        if self.first_token is not None:
+            if self.completion_tokens > 1 and now > self.first_token:
+                tokens_per_second.observe((self.completion_tokens - 1) / (now - self.first_token), **self.labels)
+        return False
+
+    def route(self, config):
+        """之後的指標改記在實際處理請求的區域，路由、重試或對沖改用其他區域時呼叫。
+
+        Args:
+            config (dict): 區域的模型配置。
+        """
+        labels = {**self.labels, **_deployment_labels(config)}
+        if labels == self.labels:
+            return
+        if self.started is not None:
+            active_streams.dec(**self.labels)
+            active_streams.inc(**labels)
+        self.labels = labels
+
+    def observe(self, event):
+        """依串流事件記錄首個token時間與用量。
+
+        Args:
+            event (StreamEvent): 上游回傳的事件。
+        """
+        if event.type == "delta":
+            self.token()
+        elif event.type == "usage":
+            self.usage(**event.data)
+
+    def queued(self, seconds):
+        """記錄等待配額的秒數。"""
+        queue_wait_seconds.observe(seconds, **self.labels)
+
+    def token(self, count=1):
+        """記錄收到的增量內容，串流沒有回傳用量時以區塊數估算token數。"""
+        if self.first_token is None:
+            self.first_token = time.monotonic()
+            time_to_first_token_seconds.observe(self.first_token - self.started, **self.labels)
+        if not self.usage_reported:
+            self.completion_tokens += count
+
+    def usage(self, prompt_tokens=None, completion_tokens=None):
+        """記錄上游回傳的token用量，取代估算的數值。"""
+        if prompt_tokens:
+            self.prompt_tokens = prompt_tokens
+        if completion_tokens:
+            self.completion_tokens = completion_tokens
+            self.usage_reported = True
+
+    def prompt(self, tokens):
+        """記錄預估的 prompt token 數，上游回傳用量時會被取代。"""
+        self.prompt_tokens = tokens
+
+    def rate_limited(self, config=None):
+        """記錄一次429。
+
+        Args:
+            config (dict, optional): 回傳429的區域配置，預設為目前的區域。
+        """
+        labels = self.labels if config is None else {**self.labels, **_deployment_labels(config)}
+        rate_limited_total.inc(**labels)
+
+    def hedged(self, winner):
+        """記錄一次對沖請求。
+
+        Args:
+            winner (str): 先回應的請求，"primary" 或 "hedge"。
+        """
+        hedges_total.inc(winner=winner, **self.labels)
+
+    def fail(self, status="error"):
+        """標記請求失敗的原因。"""
+        self.status = status
@@ -0,0 +1,299 @@
+import argparse
+import itertools
+import json
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+def _png(width=64, height=64, color=(200, 80, 40)):
+    """產生單色的PNG圖片，不依賴額外的套件。"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    row = b"\x00" + bytes(color) * width
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(row * height))
+        + chunk(b"IEND", b"")
+    )
+
+
+class MockAzureServer:
+    def __init__(self, host="127.0.0.1", port=0, tokens_per_second=50, latency=0.2, rate_limit_ratio=0.0,
+                 completion_tokens=200, file_size=1024 * 1024):
+        """模擬 Azure OpenAI 的本機伺服器，用於離線壓力測試，不會消耗真實部署的配額。
+
+        支援 chat completions 的SSE串流、Assistants 的 run 事件串流、圖像生成與檔案上傳下載。
+
+        Args:
+            host (str): 監聽的位址。
+            port (int): 監聽的連接埠，0 表示自動選擇。
+            tokens_per_second (float): 串流輸出每秒的token數。
+            latency (float): 收到請求到第一個token的秒數。
+            rate_limit_ratio (float): 回傳429的請求比例，介於0與1之間。
+            completion_tokens (int): 每次回答的token數。
+            file_size (int): Assistants 輸出檔案的位元組數。
+        """
+        self.tokens_per_second = tokens_per_second
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.completion_tokens = completion_tokens
+        self.file_size = file_size
+        self.image = _png()
+        self.requests = 0
+        self.rate_limited = 0
+        self.cancelled = 0
+        self.thread_messages = {}  # 各線程收到的使用者訊息內容，供測試檢查
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        """模擬伺服器的端點，可直接填入 model_config 的 endpoint 欄位。"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def new_id(self, prefix):
+        with self._lock:
+            return f"{prefix}_{next(self._ids)}"
+
+    def start(self):
+        """在背景執行緒啟動伺服器。
+
+        Returns:
+            MockAzureServer: 伺服器本身，方便串接呼叫。
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-azure", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止伺服器。"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass  # 壓力測試時不輸出每個請求的紀錄
+
+            def _body(self):
+                length = int(self.headers.get("content-length") or 0)
+                data = self.rfile.read(length) if length else b""
+                try:
+                    return json.loads(data) if data else {}
+                except ValueError:
+                    return {}  # 檔案上傳等非JSON內容
+
+            def _json(self, payload, status=200, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _bytes(self, data, content_type):
+                self.send_response(200)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _start_sse(self):
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("cache-control", "no-cache")
+                self.send_header("connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+            def _sse(self, data, event=None):
+                message = (f"event: {event}\n" if event else "") + f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+                self.wfile.write(message.encode("utf-8"))
+                self.wfile.flush()
+
+            def _tokens(self, wait=True):
+                """依設定的速度產生回答的token，wait 為 False 時表示已經等待過首個token的延遲。"""
+                if wait:
+                    time.sleep(server.latency)
+                interval = 1 / server.tokens_per_second if server.tokens_per_second else 0
+                for index in range(server.completion_tokens):
+                    if interval:
+                        time.sleep(interval)
+                    yield f"tok{index} "
+
+            def _rate_limited(self):
+                with server._lock:
+                    server.requests += 1
+                    limited = random.random() < server.rate_limit_ratio
+                    if limited:
+                        server.rate_limited += 1
+                if limited:
+                    self._json({"error": {"code": "429", "message": "Rate limit is exceeded."}}, 429, {"retry-after": "1"})
+                return limited
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("content-length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path.startswith("/images/"):
+                    return self._bytes(server.image, "image/png")
+                match = re.fullmatch(r"/openai/files/([^/]+)(/content)?", path)
+                if match and match.group(2):
+                    return self._bytes(b"x" * server.file_size, "application/octet-stream")
+                if match:
+                    return self._json({"id": match.group(1), "object": "file", "bytes": server.file_size, "created_at": int(time.time()),
+                                       "filename": "/mnt/data/output.csv", "purpose": "assistants_output", "status": "processed"})
+                if path == "/openai/assistants":
+                    return self._json({"object": "list", "data": [], "has_more": False})
+                match = re.fullmatch(r"/openai/threads/([^/]+)/runs/([^/]+)", path)
+                if match:
+                    return self._json({"id": match.group(2), "object": "thread.run", "thread_id": match.group(1), "status": "cancelled"})
+                self._json({"error": {"message": "not found"}}, 404)
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                body = self._body()  # 先讀完請求內容，長連線的下一個請求才不會讀到殘留的資料
+                if path.endswith("/chat/completions"):
+                    return self._chat(body)
+                if path.endswith("/images/generations"):
+                    return self._image()
+                if path == "/openai/files":
+                    return self._json({"id": server.new_id("file"), "object": "file", "bytes": 0, "created_at": int(time.time()),
+                                       "filename": "upload", "purpose": "assistants", "status": "processed"})
+                if path == "/openai/assistants":
+                    return self._json({"id": server.new_id("asst"), "object": "assistant", "created_at": int(time.time()),
+                                       "name": body.get("name"), "model": body.get("model"), "instructions": None,
+                                       "tools": body.get("tools", []), "file_ids": [], "metadata": {}, "description": None})
+                if path == "/openai/threads":
+                    thread_id = server.new_id("thread")
+                    with server._lock:
+                        server.thread_messages[thread_id] = [message.get("content") for message in body.get("messages") or []]
+                    return self._json({"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}})
+                match = re.fullmatch(r"/openai/threads/([^/]+)/messages", path)
+                if match:
+                    with server._lock:
+                        server.thread_messages.setdefault(match.group(1), []).append(body.get("content"))
+                    return self._json({"id": server.new_id("msg"), "object": "thread.message", "created_at": int(time.time()),
+                                       "thread_id": match.group(1), "role": "user", "content": [], "file_ids": [],
+                                       "assistant_id": None, "run_id": None, "metadata": {}, "status": "completed"})
+                match = re.fullmatch(r"/openai/threads/([^/]+)/runs(/[^/]+/cancel)?", path)
+                if match and match.group(2):
+                    with server._lock:
+                        server.cancelled += 1
+                    return self._json({"id": match.group(2).split("/")[1], "object": "thread.run", "thread_id": match.group(1), "status": "cancelling"})
+                if match:
+                    return self._run(match.group(1), body)
+                self._json({"error": {"message": "not found"}}, 404)
+
+            def _chat(self, body):
+                if self._rate_limited():
+                    return
+                chat_id = server.new_id("chatcmpl")
+                created = int(time.time())
+                if not body.get("stream"):
+                    text = "".join(self._tokens())
+                    return self._json({
+                        "id": chat_id, "object": "chat.completion", "created": created, "model": "mock",
+                        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+                        "usage": {"prompt_tokens": 10, "completion_tokens": server.completion_tokens, "total_tokens": 10 + server.completion_tokens},
+                    })
+                time.sleep(server.latency)  # 與 Azure 相同，開始生成後才送出第一個區塊
+                self._start_sse()
+
+                def chunk(delta, finish_reason=None):
+                    return {"id": chat_id, "object": "chat.completion.chunk", "created": created, "model": "mock",
+                            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+                try:
+                    self._sse(chunk({"role": "assistant", "content": ""}))
+                    for token in self._tokens(wait=False):
+                        self._sse(chunk({"content": token}))
+                    self._sse(chunk({}, "stop"))
+                    self._sse("[DONE]")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # 用戶端中斷串流
+
+            def _image(self):
+                if self._rate_limited():
+                    return
+                time.sleep(server.latency)
+                host, port = server._server.server_address[:2]
+                self._json({"created": int(time.time()), "data": [{
+                    "url": f"http://{host}:{port}/images/{server.new_id('img')}.png",
+                    "revised_prompt": "A mock image.",
+                }]})
+
+            def _run(self, thread_id, body):
+                if self._rate_limited():
+                    return
+                run_id = server.new_id("run")
+                message_id = server.new_id("msg")
+                created = int(time.time())
+                run = {"id": run_id, "object": "thread.run", "created_at": created, "thread_id": thread_id,
+                       "assistant_id": body.get("assistant_id"), "status": "queued", "model": "mock", "instructions": "",
+                       "tools": [], "file_ids": [], "metadata": {}}
+                self._start_sse()
+                try:
+                    self._sse(run, "thread.run.created")
+                    self._sse({"id": message_id, "object": "thread.message", "created_at": created, "thread_id": thread_id,
+                               "role": "assistant", "content": [], "file_ids": [], "assistant_id": run["assistant_id"],
+                               "run_id": run_id, "metadata": {}, "status": "in_progress"}, "thread.message.created")
+                    for index, token in enumerate(self._tokens()):
+                        self._sse({"id": message_id, "object": "thread.message.delta", "delta": {"content": [
+                            {"index": 0, "type": "text", "text": {"value": token, "annotations": []}}]}}, "thread.message.delta")
+                    self._sse({"id": message_id, "object": "thread.message.delta", "delta": {"content": [
+                        {"index": 0, "type": "image_file", "image_file": {"file_id": server.new_id("file")}}]}}, "thread.message.delta")
+                    completed = dict(run, status="completed", usage={
+                        "prompt_tokens": 10, "completion_tokens": server.completion_tokens, "total_tokens": 10 + server.completion_tokens})
+                    self._sse(completed, "thread.run.completed")
+                    self._sse("[DONE]", "done")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # 用戶端中斷串流
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock Azure OpenAI server.")
+    parser.add_argument("--port", type=int, default=8400)
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    args = parser.parse_args()
+    server = MockAzureServer(port=args.port, tokens_per_second=args.tokens_per_second, latency=args.latency,
+                             rate_limit_ratio=args.rate_limit_ratio, completion_tokens=args.completion_tokens)
+    print(f"Mock Azure OpenAI endpoint: {server.endpoint}")
+    server._server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
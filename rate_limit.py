@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+
+
+class QuotaExceeded(Exception):
+    """等待配額的請求過多或需要等待太久時拋出。"""
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        """每分鐘補滿的令牌桶，允許預支使得後到的請求依序等待。
+
+        Args:
+            per_minute (int): 每分鐘的配額。
+        """
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def reserve(self, amount, now):
+        """預先扣除配額並回傳需要等待的秒數。
+
+        Args:
+            amount (float): 要扣除的配額。
+            now (float): 目前的 monotonic 時間。
+
+        Returns:
+            float: 需要等待的秒數。
+        """
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount):
+        """歸還尚未使用的配額。"""
+        self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+
+class DeploymentLimiter:
+    def __init__(self, tpm=None, rpm=None, max_queue=50, max_wait=120):
+        """單一部署的TPM/RPM准入控制，請求在送出前先取得配額，不足時排隊等待。
+
+        Args:
+            tpm (int, optional): 每分鐘的token配額。
+            rpm (int, optional): 每分鐘的請求配額。
+            max_queue (int): 同時等待配額的請求上限。
+            max_wait (float): 單一請求最多等待的秒數。
+        """
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.waiting = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=0):
+        """預先取得一個請求與指定token數的配額。
+
+        Args:
+            tokens (int): 預估的 prompt token 數加上 max_tokens。
+
+        Returns:
+            float: 需要等待的秒數，大於0時呼叫者必須呼叫 wait。
+
+        Raises:
+            QuotaExceeded: 等待的請求過多或需要等待的時間超過上限。
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = 0.0
+            if self.requests:
+                delay = max(delay, self.requests.reserve(1, now))
+            if self.tokens and tokens:
+                delay = max(delay, self.tokens.reserve(tokens, now))
+            if delay > 0 and (self.waiting >= self.max_queue or delay > self.max_wait):
+                self._refund(tokens)
+                raise QuotaExceeded(f"The deployment is busy, please retry in {delay:.0f} seconds.")
+            if delay > 0:
+                self.waiting += 1
+            return delay
+
+    def try_reserve(self, tokens=0):
+        """只在不需要等待時取得配額，用於可以放棄的請求，例如對沖請求。
+
+        Args:
+            tokens (int): 預估的 prompt token 數加上 max_tokens。
+
+        Returns:
+            bool: 是否取得配額，False 時不會扣除任何配額。
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = 0.0
+            if self.requests:
+                delay = max(delay, self.requests.reserve(1, now))
+            if self.tokens and tokens:
+                delay = max(delay, self.tokens.reserve(tokens, now))
+            if delay > 0:
+                self._refund(tokens)
+                return False
+            return True
+
+    def _refund(self, tokens):
+        if self.requests:
+            self.requests.refund(1)
+        if self.tokens and tokens:
+            self.tokens.refund(tokens)
+
+    def refund(self, tokens=0):
+        """歸還已預先取得但沒有送出的請求配額。
+
+        Args:
+            tokens (int): 預先取得的token數。
+        """
+        with self._lock:
+            self._refund(tokens)
+
+    async def wait(self, delay, tokens=0):
+        """等待 reserve 回傳的秒數，等待中被取消時歸還配額。
+
+        Args:
+            delay (float): reserve 回傳的秒數。
+            tokens (int): 預先取得的token數。
+        """
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.refund(tokens)
+            raise
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+
+class LimiterRegistry:
+    def __init__(self):
+        """依部署共用的配額限制器，同一部署的所有使用者共用同一份配額。"""
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def get(self, config):
+        """取得指定部署的限制器。
+
+        Args:
+            config (dict): 含有 quota 欄位的模型配置，例如 {"tpm": 30000, "rpm": 180}。
+
+        Returns:
+            DeploymentLimiter: 部署的限制器，沒有設定配額時回傳None。
+        """
+        quota = config.get("quota")
+        if not quota:
+            return None
+        # 配額改變時視為新的限制器
+        key = (config["endpoint"], config["deployment"], tuple(sorted(quota.items())))
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = DeploymentLimiter(**quota)
+                self._limiters[key] = limiter
+        return limiter
+
+
+limiter_registry = LimiterRegistry()
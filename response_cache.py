@@ -0,0 +1,137 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def normalize_prompt(prompt):
+    """將提示的空白正規化，讓只差在空白或換行的相同內容使用同一個快取。"""
+    return " ".join(prompt.split())
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1000, ttl=86400, disk_dir=None, match=("翻譯",)):
+        """模型回答的快取，記憶體以LRU加上TTL淘汰，可選擇再保存一份在磁碟上。
+
+        快取的鍵不包含對話歷史，因此只適用於與歷史無關的系統訊息，例如翻譯。
+
+        Args:
+            max_entries (int): 記憶體中保留的回答數量上限。
+            ttl (float): 回答的有效秒數。
+            disk_dir (str, optional): 磁碟快取的資料夾，None 表示只使用記憶體。
+            match (list): 系統訊息包含其中任一字串時才使用快取。
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.match = tuple(match)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def applies_to(self, system_message):
+        """判斷系統訊息是否可以使用快取。"""
+        return any(keyword in system_message for keyword in self.match)
+
+    @staticmethod
+    def make_key(deployment, system_message, prompt, **params):
+        """以部署、系統訊息、正規化後的提示與生成參數產生快取的鍵。
+
+        Returns:
+            str: 快取的鍵。
+        """
+        payload = json.dumps(
+            [deployment, system_message, normalize_prompt(prompt), params],
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        """取得快取的回答，先查記憶體再查磁碟。
+
+        Args:
+            key (str): 快取的鍵。
+
+        Returns:
+            str: 快取的回答，沒有或已過期時回傳None。
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expires"] <= now:
+            return None
+        self._remember(key, entry["expires"], entry["text"])
+        return entry["text"]
+
+    def _remember(self, key, expires, text):
+        with self._lock:
+            self._entries[key] = (expires, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, key, text):
+        """保存回答。
+
+        Args:
+            key (str): 快取的鍵。
+            text (str): 模型的回答。
+        """
+        expires = time.time() + self.ttl
+        self._remember(key, expires, text)
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"expires": expires, "text": text}, f, ensure_ascii=False)
+        os.replace(temp_path, path)  # 以原子性的方式寫入，避免讀到寫到一半的檔案
+
+
+class CacheRegistry:
+    def __init__(self):
+        """依模型配置共用的回答快取。"""
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def get(self, config):
+        """取得模型的回答快取。
+
+        Args:
+            config (dict): 含有 response_cache 欄位的模型配置。
+
+        Returns:
+            ResponseCache: 模型的回答快取，未啟用時回傳None。
+        """
+        options = dict(config.get("response_cache") or {})
+        if not options.pop("enabled", False):
+            return None
+        key = (config["model_name"], json.dumps(options, sort_keys=True))  # 設定改變時建立新的快取
+        with self._lock:
+            cache = self._caches.get(key)
+            if cache is None:
+                cache = ResponseCache(**options)
+                self._caches[key] = cache
+        return cache
+
+
+cache_registry = CacheRegistry()
@@ -0,0 +1,193 @@
+import json
+import random
+import threading
+import time
+
+
+def expand(config):
+    """將含有 endpoints 的模型配置展開為每個區域各自的完整配置。
+
+    endpoints 中每一項的欄位會覆蓋模型配置的同名欄位，沒有 endpoints 時回傳原本的配置。
+
+    Args:
+        config (dict): 模型配置。
+
+    Returns:
+        list: 各區域的模型配置。
+    """
+    endpoints = config.get("endpoints")
+    if not endpoints:
+        return [config]
+    base = {key: value for key, value in config.items() if key not in ("endpoints", "routing")}
+    return [{**base, **endpoint} for endpoint in endpoints]
+
+
+class EndpointHealth:
+    def __init__(self, weight=1.0):
+        """單一區域的健康狀態，以指數移動平均記錄首個token時間與錯誤率。
+
+        Args:
+            weight (float): 區域的權重，通常與該區域的TPM成正比。
+        """
+        self.weight = weight
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+
+
+class EndpointRouter:
+    def __init__(self, configs, failure_threshold=3, cooldown=30, alpha=0.2, default_latency=1.0):
+        """在同一模型的多個區域之間分配請求，依權重、延遲與錯誤率選擇區域，連續失敗的區域暫時停用。
+
+        Args:
+            configs (list): expand 展開後的各區域配置。
+            failure_threshold (int): 連續失敗幾次後停用該區域。
+            cooldown (float): 停用的秒數，之後會再嘗試一次，成功才恢復。
+            alpha (float): 指數移動平均的權重。
+            default_latency (float): 尚未有紀錄的區域假設的首個token秒數。
+        """
+        self.configs = configs
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.default_latency = default_latency
+        self._health = {self._key(config): EndpointHealth(config.get("weight", 1.0)) for config in configs}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(config):
+        return (config["endpoint"], config["deployment"])
+
+    def _score(self, health):
+        latency = health.latency if health.latency is not None else self.default_latency
+        return health.weight / (max(latency, 0.01) * (1 + 4 * health.error_rate))
+
+    def candidates(self):
+        """依序列出這次請求要嘗試的區域。
+
+        可用的區域以分數加權隨機排序，讓負載依權重分散；停用中的區域排在最後，只在其他區域都失敗時使用。
+
+        Returns:
+            list: 各區域的模型配置。
+        """
+        if len(self.configs) == 1:
+            return list(self.configs)
+        now = time.monotonic()
+        available = []
+        tripped = []
+        with self._lock:
+            for config in self.configs:
+                health = self._health[self._key(config)]
+                if health.open_until > now:
+                    tripped.append((health.open_until, config))
+                else:
+                    # 加權隨機抽樣不放回：分數越高越可能排在前面
+                    available.append((random.random() ** (1 / self._score(health)), config))
+        available.sort(key=lambda item: item[0], reverse=True)
+        tripped.sort(key=lambda item: item[0])
+        return [config for _, config in available] + [config for _, config in tripped]
+
+    def success(self, config, ttft):
+        """記錄成功收到首個token。
+
+        Args:
+            config (dict): 區域的模型配置。
+            ttft (float): 首個token的秒數。
+        """
+        with self._lock:
+            health = self._health.get(self._key(config))
+            if health is None:
+                return
+            health.latency = ttft if health.latency is None else (1 - self.alpha) * health.latency + self.alpha * ttft
+            health.error_rate *= 1 - self.alpha
+            health.failures = 0
+            health.open_until = 0.0
+
+    def failure(self, config):
+        """記錄一次429、逾時或連線失敗，連續失敗達到門檻時停用該區域。
+
+        Args:
+            config (dict): 區域的模型配置。
+        """
+        with self._lock:
+            health = self._health.get(self._key(config))
+            if health is None:
+                return
+            health.error_rate = (1 - self.alpha) * health.error_rate + self.alpha
+            health.failures += 1
+            if health.failures >= self.failure_threshold:
+                health.open_until = time.monotonic() + self.cooldown
+
+    def stats(self):
+        """各區域目前的健康狀態，供管理者查看。
+
+        Returns:
+            dict: 以 "端點/部署" 為鍵的健康狀態。
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                f"{endpoint}/{deployment}": {
+                    "weight": health.weight,
+                    "ttft_seconds": None if health.latency is None else round(health.latency, 3),
+                    "error_rate": round(health.error_rate, 3),
+                    "open_seconds": max(0, round(health.open_until - now)),
+                }
+                for (endpoint, deployment), health in self._health.items()
+            }
+
+
+class RouterRegistry:
+    def __init__(self):
+        """依模型配置共用的區域路由器，所有使用者共用同一份健康狀態。"""
+        self._routers = {}  # 模型名稱與 (模型配置, 路由相關欄位, 路由器)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _routing_key(configs, options):
+        """只取影響路由的欄位：各區域的端點、金鑰、部署、配額、權重與路由選項。"""
+        regions = tuple(
+            (config.get("endpoint"), config.get("key"), config.get("deployment"),
+             json.dumps(config.get("quota"), sort_keys=True), config.get("weight", 1.0))
+            for config in configs
+        )
+        return regions, json.dumps(options, sort_keys=True)
+
+    def get(self, config):
+        """取得模型的路由器。
+
+        同一份模型配置直接回傳先前的路由器，重新載入設定後才比較路由相關的欄位。
+
+        Args:
+            config (dict): 模型配置，可包含 endpoints 與 routing 欄位。
+
+        Returns:
+            EndpointRouter: 模型的路由器。
+        """
+        entry = self._routers.get(config["model_name"])
+        if entry is not None and entry[0] is config:
+            return entry[2]
+        options = {key: value for key, value in (config.get("routing") or {}).items() if key != "first_token_timeout"}
+        configs = expand(config)
+        key = self._routing_key(configs, options)
+        with self._lock:
+            entry = self._routers.get(config["model_name"])
+            if entry is not None and entry[1] == key:
+                # 路由相關的欄位沒有改變時保留健康狀態，只更新各區域的配置(例如 API 版本)
+                router = entry[2]
+                router.configs = configs
+            else:
+                # 任何區域的端點、金鑰、部署或配額改變時建立新的路由器，舊配置的路由器不再使用
+                router = EndpointRouter(configs, **options)
+            self._routers[config["model_name"]] = (config, key, router)
+        return router
+
+    def stats(self):
+        """所有多區域模型的健康狀態。"""
+        with self._lock:
+            routers = [(model_name, router) for model_name, (_, _, router) in self._routers.items()]
+        return {model_name: router.stats() for model_name, router in routers if len(router.configs) > 1}
+
+
+router_registry = RouterRegistry()
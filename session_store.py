@@ -0,0 +1,95 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class SessionStore:
+    def __init__(self, path="sessions.db"):
+        """以SQLite保存使用者的對話紀錄，每次對話結束後只追加該輪的內容。
+
+        Args:
+            path (str): 資料庫檔案的路徑。
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "username TEXT NOT NULL, "
+            "model TEXT NOT NULL, "
+            "messages TEXT NOT NULL, "
+            "history TEXT NOT NULL, "
+            "created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS turns_user_model ON turns (username, model, id)")
+
+    @staticmethod
+    def _strip_images(message):
+        """移除訊息中的圖片內容，避免將base64圖片寫入資料庫。"""
+        if isinstance(message["content"], str):
+            return message
+        content = [
+            part if part.get("type") == "text" else {"type": "text", "text": "[image]"}
+            for part in message["content"]
+        ]
+        return {"role": message["role"], "content": content}
+
+    def append_turn(self, username, model, messages, history_item):
+        """追加一輪對話。
+
+        Args:
+            username (str): 用戶名。
+            model (str): 模型名稱。
+            messages (list): 本輪送給模型與模型回覆的訊息。
+            history_item (tuple): 本輪在聊天介面顯示的 (提問, 回答)。
+        """
+        messages = [self._strip_images(message) for message in messages]
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO turns (username, model, messages, history, created) VALUES (?, ?, ?, ?, ?)",
+                (
+                    username,
+                    model,
+                    json.dumps(messages, ensure_ascii=False),
+                    json.dumps(history_item, ensure_ascii=False, default=str),
+                    time.time(),
+                )
+            )
+
+    def load(self, username, model, limit=200):
+        """讀取使用者在指定模型最近的對話。
+
+        Args:
+            username (str): 用戶名。
+            model (str): 模型名稱。
+            limit (int): 讀取的對話輪數上限。
+
+        Returns:
+            tuple: 包含模型訊息列表與聊天介面歷史列表。
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT messages, history FROM turns WHERE username = ? AND model = ? ORDER BY id DESC LIMIT ?",
+                (username, model, limit)
+            ).fetchall()
+        rows.reverse()
+        messages = []
+        history = []
+        for turn_messages, history_item in rows:
+            messages.extend(json.loads(turn_messages))
+            history.append(tuple(json.loads(history_item)))
+        return messages, history
+
+    def clear(self, username, model):
+        """刪除使用者在指定模型的所有對話。
+
+        Args:
+            username (str): 用戶名。
+            model (str): 模型名稱。
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM turns WHERE username = ? AND model = ?", (username, model))
@@ -0,0 +1,224 @@
+import asyncio
+from contextlib import aclosing, asynccontextmanager
+import threading
+import time
+
+
+class StreamEvent:
+    def __init__(self, type, content="", data=None):
+        """串流輸出的事件，模型回應以增量(delta)的方式逐段傳遞。
+
+        Args:
+            type (str): 事件類型，"delta" 為新增的文字、"usage" 為 token 用量、"finish" 為結束資訊、"error" 為錯誤訊息。
+            content (str, optional): 此事件新增的文字內容。
+            data (dict, optional): 附帶的中繼資料，例如 usage 或 finish_reason。
+        """
+        self.type = type
+        self.content = content
+        self.data = data or {}
+
+    def __repr__(self):
+        return f"StreamEvent(type={self.type!r}, content={self.content!r}, data={self.data!r})"
+
+
+async def acoalesce(events, interval=0.05, max_chars=256):
+    """將增量事件依時間或大小合併後再輸出，減少推送到前端的更新次數。
+
+    緩衝區有文字時，下一個事件最多等待到 interval 到期，不會因為上游較慢而延遲已收到的文字。
+
+    Args:
+        events (async iterable): StreamEvent 的非同步迭代器。
+        interval (float): 兩次輸出之間的最短間隔秒數。
+        max_chars (int): 累積超過此字數時立即輸出。
+
+    Yields:
+        str: 本次合併後新增的文字。
+    """
+    buffer = []
+    size = 0
+    last_flush = time.monotonic()
+    iterator = events.__aiter__()
+    pending = None  # 等待下一個事件的 Task，輸出緩衝區時不中斷
+    async with aclosing(events):
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                timeout = max(0, last_flush + interval - time.monotonic()) if buffer else None
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+                if not done:
+                    # 到了輸出的時間仍沒有新的事件，先輸出已收到的文字
+                    yield "".join(buffer)
+                    buffer = []
+                    size = 0
+                    last_flush = time.monotonic()
+                    continue
+                task, pending = pending, None
+                try:
+                    event = task.result()
+                except StopAsyncIteration:
+                    break
+                if event.type not in ("delta", "error") or not event.content:
+                    continue
+                buffer.append(event.content)
+                size += len(event.content)
+                now = time.monotonic()
+                if size >= max_chars or now - last_flush >= interval:
+                    yield "".join(buffer)
+                    buffer = []
+                    size = 0
+                    last_flush = now
+        finally:
+            if pending is not None:
+                # 提前結束時先中斷等待中的事件，才能關閉上游的產生器
+                pending.cancel()
+                await asyncio.wait({pending})
+                if not pending.cancelled():
+                    pending.exception()
+    if buffer:
+        yield "".join(buffer)
+
+
+async def aaccumulate(events):
+    """將增量事件轉換為累積的完整字串，供舊有的串流介面使用。
+
+    Args:
+        events (async iterable): StreamEvent 的非同步迭代器。
+
+    Yields:
+        str: 目前為止累積的完整回應。
+    """
+    parts = []
+    async with aclosing(events):
+        async for event in events:
+            if event.type in ("delta", "error") and event.content:
+                parts.append(event.content)
+                yield "".join(parts)
+
+
+class StreamHandle:
+    def __init__(self, task, session=None):
+        """一個進行中的串流，取消時會中斷執行它的工作。
+
+        Args:
+            task (asyncio.Task): 執行串流的工作。
+            session (str, optional): 發起串流的 Gradio session。
+        """
+        self.task = task
+        self.session = session
+        self.cancelled = False
+        self.finished = asyncio.Event()
+
+    def cancel(self):
+        """中斷串流，上游的連線會在產生器的 finally 中關閉。"""
+        if not self.cancelled and not self.task.done():
+            self.cancelled = True
+            self.task.cancel()
+
+
+class ActiveStreams:
+    def __init__(self):
+        """記錄每位使用者正在進行的串流，新的提問或關閉頁面時取消先前的串流。
+
+        只能在事件迴圈的執行緒中使用。
+        """
+        self._streams = {}
+
+    @asynccontextmanager
+    async def track(self, key, session=None, cleanup_timeout=5):
+        """以 async with 包住串流的處理，同一個 key 先前的串流會被取消，並等待其清理完成後才開始。
+
+        被 ActiveStreams 取消的串流會正常結束，其他原因的取消(例如停止按鈕)照常拋出。
+
+        Args:
+            key (tuple): 串流的識別，例如 (用戶名, 模型名稱)。
+            session (str, optional): 發起串流的 Gradio session。
+            cleanup_timeout (float): 等待先前的串流清理的秒數上限。
+
+        Yields:
+            StreamHandle: 此次串流。
+        """
+        previous = self._streams.get(key)
+        if previous is not None:
+            previous.cancel()
+            # 先前的串流可能仍在關閉連線或取消 run，完成後才能使用同一個對話
+            try:
+                await asyncio.wait_for(previous.finished.wait(), cleanup_timeout)
+            except asyncio.TimeoutError:
+                pass
+        handle = StreamHandle(asyncio.current_task(), session)
+        self._streams[key] = handle
+        try:
+            yield handle
+        except asyncio.CancelledError:
+            if not handle.cancelled:
+                raise
+            handle.task.uncancel()
+        finally:
+            if self._streams.get(key) is handle:
+                del self._streams[key]
+            handle.finished.set()
+
+    def cancel_session(self, session):
+        """取消某個 session 所有進行中的串流。
+
+        Args:
+            session (str): Gradio 的 session。
+
+        Returns:
+            int: 取消的串流數量。
+        """
+        cancelled = 0
+        for key, handle in list(self._streams.items()):
+            if handle.session == session:
+                handle.cancel()
+                cancelled += 1
+        return cancelled
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop():
+    """取得在背景執行緒中運行的事件迴圈，供同步介面呼叫非同步的實作。"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="chatgpt-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_sync(coro):
+    """在背景事件迴圈中執行協程並等待結果。
+
+    Args:
+        coro (coroutine): 要執行的協程。
+
+    Returns:
+        協程的回傳值。
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+def iter_sync(agen):
+    """將非同步產生器包裝成同步產生器，提前結束時會一併關閉非同步產生器。
+
+    Args:
+        agen (async generator): 非同步產生器。
+
+    Yields:
+        非同步產生器輸出的每個值。
+    """
+    loop = _background_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
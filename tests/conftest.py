@@ -0,0 +1,10 @@
+import os
+import sys
+import types
+
+# 專案以 ChatGPT_Web 套件名稱匯入，從任意資料夾名稱的原始碼執行測試時建立對應的套件
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if "ChatGPT_Web" not in sys.modules:
+    package = types.ModuleType("ChatGPT_Web")
+    package.__path__ = [ROOT]
+    sys.modules["ChatGPT_Web"] = package
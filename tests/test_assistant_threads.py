@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("litellm")
+
+from ChatGPT_Web.call_gpt import ChatGPT
+from ChatGPT_Web.mock_azure import MockAzureServer
+
+
+def _config(east, west):
+    def resource(server):
+        return {"endpoint": server.endpoint, "key": "k", "deployment": "d", "api-version": "2024-02-15-preview"}
+    return {"model_name": "Assistants", "GPT-3.5 Turbo": resource(east), "GPT-4 Turbo": resource(west)}
+
+
+async def _ask(chatgpt, prompt, use_model):
+    return [text async for text, *_ in chatgpt.aassistant_stream_output(prompt, [], use_model, "") if text]
+
+
+def test_switching_back_replays_turns_from_the_other_resource():
+    with MockAzureServer(latency=0, tokens_per_second=0, completion_tokens=3) as east, \
+            MockAzureServer(latency=0, tokens_per_second=0, completion_tokens=3) as west:
+        chatgpt = ChatGPT(_config(east, west))
+
+        async def main():
+            await _ask(chatgpt, "first", "GPT-3.5 Turbo")
+            await _ask(chatgpt, "second", "GPT-4 Turbo")
+            await _ask(chatgpt, "third", "GPT-3.5 Turbo")
+            await _ask(chatgpt, "fourth", "GPT-3.5 Turbo")
+
+        asyncio.run(main())
+        (east_thread,) = east.thread_messages.values()
+        assert east_thread[0] == "first"
+        assert "second" in east_thread[1] and "first" not in east_thread[1]
+        assert east_thread[2:] == ["third", "fourth"]
+        (west_thread,) = west.thread_messages.values()
+        assert "first" in west_thread[0]
+        assert west_thread[1] == "second"
+
+
+def test_reset_thread_starts_over():
+    with MockAzureServer(latency=0, tokens_per_second=0, completion_tokens=3) as east, \
+            MockAzureServer(latency=0, tokens_per_second=0, completion_tokens=3) as west:
+        chatgpt = ChatGPT(_config(east, west))
+        asyncio.run(_ask(chatgpt, "first", "GPT-3.5 Turbo"))
+        chatgpt.reset_thread()
+        asyncio.run(_ask(chatgpt, "again", "GPT-3.5 Turbo"))
+        assert sorted(east.thread_messages.values()) == [["again"], ["first"]]
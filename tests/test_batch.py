@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("litellm")
+
+from ChatGPT_Web.batch import arun_batch, completed_ids, load_prompts, resolve_model
+from ChatGPT_Web.mock_azure import MockAzureServer
+
+
+def _write_lines(path, lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+
+
+def test_load_prompts_uses_line_numbers_without_ids(tmp_path):
+    path = tmp_path / "in.jsonl"
+    _write_lines(path, ['{"id": "a", "prompt": "one"}', "", '{"text": "two"}'])
+    assert list(load_prompts(str(path))) == [("a", "one"), ("3", "two")]
+    _write_lines(path, ['{"id": "a"}'])
+    with pytest.raises(ValueError):
+        list(load_prompts(str(path)))
+
+
+def test_completed_ids_skip_failures_and_partial_lines(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"id": "1", "error": null}\n{"id": "2", "error": "boom"}\n{"id": "3", "err', encoding="utf-8")
+    assert completed_ids(str(path)) == {"1"}
+    assert completed_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_resolve_model_rejects_models_without_batch_support():
+    models = [{"model_name": "GPT-3.5 Turbo"}, {"model_name": "GPT-4 Vision"}]
+    assert resolve_model(models, "GPT-3.5 Turbo") is models[0]
+    for name in ("GPT-4 Vision", "Missing"):
+        with pytest.raises(ValueError):
+            resolve_model(models, name)
+
+
+def test_batch_checkpoints_and_resumes(tmp_path):
+    source, output, config = tmp_path / "in.jsonl", tmp_path / "out.jsonl", tmp_path / "model_config.json"
+    _write_lines(source, [json.dumps({"id": str(index), "prompt": f"q{index}"}) for index in range(5)])
+    # 上一次執行完成了一筆，並在寫入第二筆時中斷
+    output.write_text('{"id": "0", "response": "old", "error": null}\n{"id": "1", "resp', encoding="utf-8")
+    with MockAzureServer(latency=0, tokens_per_second=0, completion_tokens=3) as server:
+        config.write_text(json.dumps([{"model_name": "GPT-3.5 Turbo", "endpoint": server.endpoint, "key": "k",
+                                       "deployment": "d", "api-version": "2024-02-01"}]), encoding="utf-8")
+        kwargs = dict(system_prompt="You are a test.", concurrency=2, config_path=str(config))
+        stats = asyncio.run(arun_batch(str(source), str(output), "GPT-3.5 Turbo", **kwargs))
+        assert (stats["total"], stats["skipped"], stats["succeeded"], stats["failed"]) == (5, 1, 4, 0)
+        assert server.requests == 4
+        again = asyncio.run(arun_batch(str(source), str(output), "GPT-3.5 Turbo", **kwargs))
+        assert (again["skipped"], again["succeeded"]) == (5, 0)
+        assert server.requests == 4
+    lines = output.read_text(encoding="utf-8").splitlines()
+    assert lines[1] == '{"id": "1", "resp'  # 不完整的一行被換行隔開，不影響後續的紀錄
+    results = {item["id"]: item for item in map(json.loads, lines[:1] + lines[2:])}
+    assert sorted(results) == ["0", "1", "2", "3", "4"]
+    assert results["4"]["response"] == "tok0 tok1 tok2 " and results["4"]["finish_reason"] == "stop"
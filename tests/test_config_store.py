@@ -0,0 +1,58 @@
+import json
+import os
+
+import pytest
+
+from ChatGPT_Web.config_store import ConfigStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "user_config.json"
+    path.write_text(json.dumps([{"nick": "pw"}, {"nick": {"default": "hi"}}]), encoding="utf-8")
+    return str(path)
+
+
+def write_externally(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))  # 確保修改時間不同
+
+
+def test_reads_users_and_messages(path):
+    store = ConfigStore(path)
+    assert store.check_password("nick", "pw")
+    assert not store.check_password("nick", "wrong")
+    assert store.system_messages("nick") == {"default": "hi"}
+
+
+def test_flush_without_edits_keeps_external_changes(path):
+    store = ConfigStore(path)
+    write_externally(path, [{"nick": "pw"}, {"nick": {"default": "edited on disk"}}])
+    store.flush()  # 等同程序結束時的 atexit
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)[1]["nick"]["default"] == "edited on disk"
+
+
+def test_edits_are_written_back(path):
+    store = ConfigStore(path, write_delay=60)
+    store.set_system_message("nick", "翻譯", "translate")
+    store.flush()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)[1]["nick"] == {"default": "hi", "翻譯": "translate"}
+    store.delete_system_message("nick", "翻譯")
+    store.flush()
+    assert ConfigStore(path).system_messages("nick") == {"default": "hi"}
+
+
+def test_reload_picks_up_disk_changes_unless_dirty(path):
+    store = ConfigStore(path, write_delay=60)
+    assert not store.reload()
+    write_externally(path, [{"nick": "pw", "amy": "pw"}, {"nick": {"default": "new"}, "amy": {"default": "a"}}])
+    store.set_system_message("nick", "x", "y")
+    assert not store.reload()  # 未寫回的修改優先
+    store.flush()
+    write_externally(path, [{"nick": "pw", "amy": "pw"}, {"nick": {"default": "new"}, "amy": {"default": "a"}}])
+    assert store.reload()
+    assert store.has_user("amy")
@@ -0,0 +1,54 @@
+from ChatGPT_Web.context_window import ContextWindow
+
+
+def window(**kwargs):
+    context = ContextWindow(**kwargs)
+    context.encoder = None  # 以字元估算，結果不受 tiktoken 版本影響
+    return context
+
+
+def conversation(turns):
+    messages = [{"role": "system", "content": "system"}]
+    for index in range(turns):
+        messages.append({"role": "user", "content": f"question {index} " * 10})
+        messages.append({"role": "assistant", "content": f"answer {index} " * 10})
+    return messages
+
+
+def test_fit_returns_same_list_when_within_budget():
+    messages = conversation(2)
+    assert window(max_tokens=10000).fit(messages) is messages
+
+
+def test_fit_drops_oldest_turns_and_keeps_system():
+    context = window(max_tokens=200)
+    messages = conversation(10)
+    fitted = context.fit(messages, completion_tokens=50)
+    assert fitted[0] == messages[0]
+    assert fitted[-1] == messages[-1]
+    assert len(fitted) < len(messages)
+    assert context.total(fitted) + 50 <= 200
+    assert fitted[1]["role"] == "user"
+
+
+def test_fit_keeps_pinned_turns():
+    messages = conversation(10)
+    fitted = window(max_tokens=250, pinned_turns=2).fit(messages)
+    assert fitted[:3] == messages[:3]
+    assert fitted[-1] == messages[-1]
+
+
+def test_fit_always_keeps_latest_message():
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "x" * 4000}]
+    assert window(max_tokens=100).fit(messages)[-1] == messages[-1]
+
+
+def test_count_images_and_wide_characters():
+    context = window(image_tokens=765)
+    message = {"role": "user", "content": [{"type": "image_url", "image_url": "data:"}, {"type": "text", "text": "翻譯"}]}
+    assert context.count(message) == 3 + 765 + 2
+
+
+def test_from_config():
+    context = ContextWindow.from_config({"context_window": {"max_tokens": 16385, "pinned_turns": 1}})
+    assert (context.max_tokens, context.pinned_turns) == (16385, 1)
@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("litellm")
+
+from ChatGPT_Web.call_gpt import ChatGPT
+from ChatGPT_Web.mock_azure import MockAzureServer
+from ChatGPT_Web.router import router_registry
+
+
+def _server(**kwargs):
+    return MockAzureServer(**{"latency": 0, "tokens_per_second": 0, "completion_tokens": 5, **kwargs})
+
+
+def _config(name, first, second, **extra):
+    # 權重相差很大，第一個區域幾乎一定排在最前面
+    return {"model_name": name, "key": "k", "deployment": "d", "api-version": "2024-02-01", "endpoints": [
+        {"endpoint": first.endpoint, "weight": 1000},
+        {"endpoint": second.endpoint, "weight": 0.001},
+    ], **extra}
+
+
+def _ask(config):
+    async def main():
+        events = ChatGPT(config).aget_response("hello", 50, "u", delta=True)
+        return [event async for event in events]
+
+    started = time.monotonic()
+    events = asyncio.run(main())
+    return events, time.monotonic() - started
+
+
+def _text(events):
+    assert [event for event in events if event.type == "error"] == []
+    return "".join(event.content for event in events if event.type == "delta")
+
+
+def test_rate_limited_region_fails_over_before_any_output():
+    with _server(rate_limit_ratio=1.0) as east, _server() as west:
+        config = _config("failover-429", east, west)
+        events, _ = _ask(config)
+        assert _text(events) == "tok0 tok1 tok2 tok3 tok4 "
+        assert east.rate_limited >= 1 and west.requests == 1
+        stats = router_registry.get(config).stats()
+        assert stats[f"{east.endpoint}/d"]["error_rate"] > 0
+
+
+def test_slow_first_token_fails_over_after_timeout():
+    with _server(latency=3) as east, _server() as west:
+        config = _config("failover-timeout", east, west, routing={"first_token_timeout": 0.5})
+        events, seconds = _ask(config)
+        assert _text(events).startswith("tok0")
+        assert (east.requests, west.requests) == (1, 1)
+        assert seconds < 2
+
@@ -0,0 +1,54 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from ChatGPT_Web.client_pool import client_registry
+from ChatGPT_Web.file_store import FileStore, StorageQuotaExceeded
+from ChatGPT_Web.mock_azure import MockAzureServer
+
+
+def _fetch(store, server, *requests):
+    async def main():
+        client = client_registry.get_async(server.endpoint, "2024-02-15-preview", "k")
+        return await asyncio.gather(*(store.fetch(username, client, file_id, file_type)
+                                      for username, file_id, file_type in requests))
+
+    return asyncio.run(main())
+
+
+def test_fetch_streams_into_per_user_folders_once(tmp_path):
+    store = FileStore(str(tmp_path))
+    with MockAzureServer(file_size=1000) as server:
+        first, again, other = _fetch(store, server, ("alice", "file-1", None), ("alice", "file-1", None), ("bob", "file-1", "image"))
+    assert first == again == os.path.join(str(tmp_path), "alice", "file-1", "output.csv")
+    assert other == os.path.join(str(tmp_path), "bob", "file-1", "file-1.png")
+    assert os.path.getsize(first) == 1000
+    assert os.listdir(tmp_path / "alice" / "file-1") == ["output.csv"]
+
+
+def test_file_larger_than_quota_is_rejected_and_removed(tmp_path):
+    store = FileStore(str(tmp_path), quota_bytes=500)
+    with MockAzureServer(file_size=1000) as server:
+        with pytest.raises(StorageQuotaExceeded):
+            _fetch(store, server, ("alice", "file-1", "image"))
+    assert os.listdir(tmp_path / "alice") == []
+
+
+def test_quota_removes_the_oldest_files(tmp_path):
+    store = FileStore(str(tmp_path), quota_bytes=2500)
+    with MockAzureServer(file_size=1000) as server:
+        oldest, = _fetch(store, server, ("alice", "file-1", "image"))
+        os.utime(oldest, (time.time() - 60, time.time() - 60))
+        _fetch(store, server, ("alice", "file-2", "image"), ("alice", "file-3", "image"))
+    assert sorted(os.listdir(tmp_path / "alice")) == ["file-2", "file-3"]
+
+
+def test_sweep_removes_expired_files(tmp_path):
+    store = FileStore(str(tmp_path), ttl=60)
+    with MockAzureServer(file_size=10) as server:
+        old, new = _fetch(store, server, ("alice", "file-1", "image"), ("bob", "file-2", "image"))
+    os.utime(old, (time.time() - 120, time.time() - 120))
+    assert store.sweep() == 1
+    assert not os.path.exists(old) and os.path.exists(new)
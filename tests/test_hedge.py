@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("litellm")
+
+from ChatGPT_Web.call_gpt import ChatGPT
+from ChatGPT_Web.metrics import hedges_total
+from ChatGPT_Web.mock_azure import MockAzureServer
+
+
+def _config(name, slow, fast, delay):
+    # 權重相差很大，較慢的區域幾乎一定是主要請求
+    return {"model_name": name, "key": "k", "deployment": "d", "api-version": "2024-02-01", "endpoints": [
+        {"endpoint": slow.endpoint, "weight": 1000},
+        {"endpoint": fast.endpoint, "weight": 0.001},
+    ], "hedge": {"enabled": True, "delay": delay}}
+
+
+def _ask(config):
+    async def main():
+        events = ChatGPT(config).aget_response("hello", 50, "u", delta=True)
+        return [event async for event in events]
+
+    started = time.monotonic()
+    events = asyncio.run(main())
+    assert [event for event in events if event.type == "error"] == []
+    return "".join(event.content for event in events if event.type == "delta"), time.monotonic() - started
+
+
+def _server(latency):
+    return MockAzureServer(latency=latency, tokens_per_second=0, completion_tokens=5)
+
+
+def test_hedge_takes_the_first_stream_to_answer():
+    with _server(3) as slow, _server(0) as fast:
+        text, seconds = _ask(_config("hedged", slow, fast, 0.2))
+        assert text.startswith("tok0")
+        assert (slow.requests, fast.requests) == (1, 1)
+        assert seconds < 2
+        labels = {"deployment": "d", "endpoint": "127.0.0.1", "tab": "hedged", "winner": "hedge"}
+        assert hedges_total._values[hedges_total._key(labels)] == 1
+
+
+def test_no_hedge_when_the_primary_answers_in_time():
+    with _server(0) as primary, _server(0) as other:
+        text, _ = _ask(_config("not-hedged", primary, other, 1))
+        assert text.startswith("tok0")
+        assert (primary.requests, other.requests) == (1, 0)
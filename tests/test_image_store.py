@@ -0,0 +1,60 @@
+import asyncio
+import os
+import time
+
+from ChatGPT_Web.image_store import ImageStore
+from ChatGPT_Web.mock_azure import MockAzureServer
+
+
+def _save(store, server, prompt):
+    async def main():
+        path = await store.download(server.endpoint + "images/a.png")
+        thumbnail = await store.thumbnail(path)
+        return path, thumbnail
+
+    path, thumbnail = asyncio.run(main())
+    key = store.make_key("dalle", prompt, "1024x1024", "vivid", "standard")
+    store.remember(key, "revised " + prompt, path, thumbnail)
+    return key, path, thumbnail
+
+
+def test_download_is_content_addressed_and_cached(tmp_path):
+    store = ImageStore(str(tmp_path))
+    with MockAzureServer() as server:
+        key, path, thumbnail = _save(store, server, "a cat")
+        _, again, _ = _save(store, server, "a dog")
+    assert again == path  # 相同內容只保留一份
+    assert os.path.exists(thumbnail)
+    assert store.lookup(key)["revised_prompt"] == "revised a cat"
+    assert store.make_key("dalle", "a  cat", "1024x1024", "vivid", "standard") == key
+    assert store.lookup(store.make_key("dalle", "a cat", "1024x1024", "vivid", "hd")) is None
+
+
+def test_sweep_removes_expired_images_and_their_entries(tmp_path):
+    store = ImageStore(str(tmp_path), ttl=60)
+    with MockAzureServer() as server:
+        key, path, thumbnail = _save(store, server, "a cat")
+    assert store.sweep() == 0
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert store.sweep() == 1
+    assert not os.path.exists(path) and not os.path.exists(thumbnail)
+    assert store.lookup(key) is None
+    assert os.listdir(tmp_path / "prompts") == []
+
+
+def test_sweep_keeps_recently_used_images_under_the_size_cap(tmp_path):
+    store = ImageStore(str(tmp_path))
+    paths = []
+    for index in range(3):
+        directory = tmp_path / f"0{index}"
+        directory.mkdir()
+        path = directory / f"{index}.png"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (time.time() - 100 + index, time.time() - 100 + index))
+        paths.append(str(path))
+    store.remember("key0", "p", paths[0], None)
+    assert store.lookup("key0") is not None  # 使用過的圖片變為最新
+    store.max_bytes = 200
+    assert store.sweep() == 1
+    assert [os.path.exists(path) for path in paths] == [True, False, True]
@@ -0,0 +1,46 @@
+import base64
+import io
+
+from PIL import Image
+
+from ChatGPT_Web.image_utils import ImageEncoder
+
+
+def _decode(url):
+    header, data = url.split(",", 1)
+    return header, Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+def _save(path, size, mode="RGB"):
+    Image.new(mode, size).save(path)
+    return str(path)
+
+
+def test_large_images_are_downscaled_to_the_vision_limits(tmp_path):
+    header, image = _decode(ImageEncoder().encode(_save(tmp_path / "wide.png", (4000, 1000))))
+    assert header == "data:image/jpeg;base64"
+    assert image.size == (2048, 512)
+    _, image = _decode(ImageEncoder().encode(_save(tmp_path / "square.png", (2000, 2000))))
+    assert image.size == (768, 768)
+
+
+def test_small_images_keep_their_size_and_transparency(tmp_path):
+    header, image = _decode(ImageEncoder().encode(_save(tmp_path / "icon.png", (100, 50), "RGBA")))
+    assert header == "data:image/webp;base64"
+    assert image.size == (100, 50)
+
+
+def test_same_content_is_encoded_once(tmp_path):
+    encoder = ImageEncoder(cache_size=1)
+    first = _save(tmp_path / "a.png", (10, 10))
+    copy = _save(tmp_path / "b.png", (10, 10))
+    url = encoder.encode(first)
+    assert encoder.encode(copy) is url
+    encoder.encode(_save(tmp_path / "c.png", (20, 20)))
+    assert encoder.encode(first) is not url  # 超過快取上限，最久未使用的結果已被移除
+
+
+def test_encode_many_keeps_the_input_order(tmp_path):
+    paths = [_save(tmp_path / f"{index}.png", (10 + index, 10)) for index in range(3)]
+    urls = ImageEncoder().encode_many(paths)
+    assert [_decode(url)[1].size[0] for url in urls] == [10, 11, 12]
@@ -0,0 +1,52 @@
+import pytest
+
+from ChatGPT_Web.metrics import Counter, Histogram, RequestTracker, active_streams, rate_limited_total, requests_total
+from ChatGPT_Web.streaming import StreamEvent
+
+
+def _config(name, endpoint="https://east.example.com/"):
+    return {"model_name": "tests", "deployment": name, "endpoint": endpoint}
+
+
+def test_render_prometheus_text():
+    counter = Counter("test_total", "Test counter.", ("deployment",))
+    counter.inc(2, deployment='a"b')
+    histogram = Histogram("test_seconds", "Test histogram.", (1, 5), ("deployment",))
+    histogram.observe(3, deployment="d")
+    assert 'test_total{deployment="a\\"b"} 2' in counter.render()
+    lines = histogram.render().splitlines()
+    assert 'test_seconds_bucket{deployment="d",le="1"} 0' in lines
+    assert 'test_seconds_bucket{deployment="d",le="+Inf"} 1' in lines
+    assert 'test_seconds_count{deployment="d"} 1' in lines
+
+
+def test_tracker_records_status_and_tokens():
+    labels = {"deployment": "track", "endpoint": "east.example.com", "tab": "tests"}
+    with RequestTracker(_config("track")) as tracker:
+        assert active_streams._values[active_streams._key(labels)] == 1
+        tracker.observe(StreamEvent("delta", "a"))
+        tracker.observe(StreamEvent("usage", data={"prompt_tokens": 5, "completion_tokens": 7}))
+        assert tracker.completion_tokens == 7
+    assert active_streams._values[active_streams._key(labels)] == 0
+    assert requests_total._values[requests_total._key({**labels, "status": "ok"})] == 1
+
+    with pytest.raises(RuntimeError):
+        with RequestTracker(_config("track")):
+            raise RuntimeError()
+    assert requests_total._values[requests_total._key({**labels, "status": "error"})] == 1
+
+
+def test_tracker_labels_the_region_that_served_the_request():
+    base = {"model_name": "tests", "endpoints": []}
+    west = _config("routed", "https://west.example.com/")
+    with RequestTracker(base) as tracker:
+        tracker.route(_config("routed"))
+        tracker.rate_limited()
+        tracker.route(west)
+        tracker.rate_limited(_config("routed"))
+    east_labels = {"deployment": "routed", "endpoint": "east.example.com", "tab": "tests"}
+    west_labels = {"deployment": "routed", "endpoint": "west.example.com", "tab": "tests"}
+    assert rate_limited_total._values[rate_limited_total._key(east_labels)] == 2
+    assert requests_total._values[requests_total._key({**west_labels, "status": "ok"})] == 1
+    assert active_streams._values[active_streams._key(east_labels)] == 0
+    assert active_streams._values[active_streams._key(west_labels)] == 0
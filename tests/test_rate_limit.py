@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from ChatGPT_Web.rate_limit import DeploymentLimiter, LimiterRegistry, QuotaExceeded, TokenBucket
+
+
+def test_token_bucket_delay_after_capacity():
+    bucket = TokenBucket(60)
+    assert bucket.reserve(60, bucket.updated) == 0
+    assert bucket.reserve(1, bucket.updated) == pytest.approx(1.0)
+    bucket.refund(1)
+    assert bucket.reserve(1, bucket.updated) == pytest.approx(1.0)
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.reserve(60, now)
+    assert bucket.reserve(10, now + 10) == 0
+
+
+def test_limiter_queues_then_rejects():
+    limiter = DeploymentLimiter(rpm=60, max_queue=1, max_wait=120)
+    for _ in range(60):
+        assert limiter.reserve() == 0
+    assert limiter.reserve() > 0
+    with pytest.raises(QuotaExceeded):
+        limiter.reserve()  # 等待佇列已滿
+
+
+def test_limiter_rejects_long_waits_and_refunds():
+    limiter = DeploymentLimiter(tpm=1000, max_wait=5)
+    assert limiter.reserve(1000) == 0
+    with pytest.raises(QuotaExceeded):
+        limiter.reserve(500)  # 需要等待30秒
+    assert limiter.waiting == 0
+    assert limiter.tokens.level == pytest.approx(0, abs=1)
+
+
+def test_try_reserve_never_queues():
+    limiter = DeploymentLimiter(tpm=1000, rpm=10)
+    assert limiter.try_reserve(800)
+    level = limiter.tokens.level
+    assert not limiter.try_reserve(800)
+    assert limiter.tokens.level == pytest.approx(level, abs=1)
+    assert limiter.waiting == 0
+
+
+def test_wait_refunds_when_cancelled():
+    limiter = DeploymentLimiter(tpm=1000)
+    limiter.reserve(1000)
+    delay = limiter.reserve(500)
+
+    async def cancel():
+        task = asyncio.ensure_future(limiter.wait(delay, 500))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+    assert limiter.waiting == 0
+    assert limiter.tokens.level > -1
+
+
+def test_registry_shares_and_rebuilds_on_quota_change():
+    registry = LimiterRegistry()
+    config = {"endpoint": "https://a/", "deployment": "d", "quota": {"tpm": 1000}}
+    assert registry.get({"endpoint": "https://a/", "deployment": "d"}) is None
+    limiter = registry.get(config)
+    assert registry.get(dict(config)) is limiter
+    assert registry.get({**config, "quota": {"tpm": 2000}}) is not limiter
@@ -0,0 +1,43 @@
+from ChatGPT_Web import response_cache
+from ChatGPT_Web.response_cache import CacheRegistry, ResponseCache
+
+
+def test_key_ignores_whitespace_but_not_parameters():
+    key = ResponseCache.make_key("d", "翻譯", "hello  world\n", max_tokens=100)
+    assert key == ResponseCache.make_key("d", "翻譯", "hello world", max_tokens=100)
+    assert key != ResponseCache.make_key("d", "翻譯", "hello world", max_tokens=200)
+    assert key != ResponseCache.make_key("e", "翻譯", "hello world", max_tokens=100)
+
+
+def test_applies_only_to_matching_system_messages():
+    cache = ResponseCache(match=["翻譯"])
+    assert cache.applies_to("翻譯成英文")
+    assert not cache.applies_to("You are a helpful assistant.")
+
+
+def test_ttl_and_lru(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: clock[0])
+    cache = ResponseCache(max_entries=2, ttl=10)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"
+    cache.set("c", "C")
+    assert cache.get("b") is None  # 最久未使用的被淘汰
+    clock[0] += 11
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    ResponseCache(disk_dir=str(tmp_path)).set("ab12", "text")
+    assert ResponseCache(disk_dir=str(tmp_path)).get("ab12") == "text"
+    assert ResponseCache(disk_dir=str(tmp_path)).get("cd34") is None
+
+
+def test_registry_is_opt_in_and_rebuilds_on_change():
+    registry = CacheRegistry()
+    assert registry.get({"model_name": "m"}) is None
+    assert registry.get({"model_name": "m", "response_cache": {"enabled": False}}) is None
+    cache = registry.get({"model_name": "m", "response_cache": {"enabled": True, "ttl": 10}})
+    assert registry.get({"model_name": "m", "response_cache": {"enabled": True, "ttl": 10}}) is cache
+    assert registry.get({"model_name": "m", "response_cache": {"enabled": True, "ttl": 20}}) is not cache
@@ -0,0 +1,69 @@
+import random
+
+from ChatGPT_Web.router import EndpointRouter, RouterRegistry, expand
+
+
+def regions():
+    return [
+        {"endpoint": "https://east/", "deployment": "d", "weight": 3},
+        {"endpoint": "https://west/", "deployment": "d", "weight": 1},
+    ]
+
+
+def test_expand_overrides_base_fields():
+    config = {"model_name": "m", "endpoint": "https://base/", "key": "k", "deployment": "d",
+              "endpoints": [{"endpoint": "https://east/", "key": "e"}], "routing": {"cooldown": 5}}
+    assert expand(config) == [{"model_name": "m", "endpoint": "https://east/", "key": "e", "deployment": "d"}]
+    single = {"model_name": "m", "endpoint": "https://base/", "deployment": "d"}
+    assert expand(single) == [single]
+
+
+def test_candidates_follow_weights():
+    random.seed(0)
+    router = EndpointRouter(regions())
+    first = [router.candidates()[0]["endpoint"] for _ in range(2000)]
+    assert 0.65 < first.count("https://east/") / len(first) < 0.85
+
+
+def test_failures_open_circuit_and_success_closes_it():
+    router = EndpointRouter(regions(), failure_threshold=2, cooldown=30)
+    east = router.configs[0]
+    router.failure(east)
+    router.failure(east)
+    for _ in range(20):
+        assert router.candidates()[-1] is east
+    assert router.stats()["https://east//d"]["open_seconds"] > 0
+    router.success(east, 0.5)
+    assert router.stats()["https://east//d"]["open_seconds"] == 0
+
+
+def test_registry_rebuilds_when_single_endpoint_config_changes():
+    registry = RouterRegistry()
+    config = {"model_name": "m", "endpoint": "https://old/", "key": "OLD", "deployment": "d", "api-version": "v1"}
+    router = registry.get(config)
+    assert registry.get(dict(config)) is router
+    updated = {**config, "endpoint": "https://new/", "key": "NEW", "quota": {"tpm": 1000}}
+    candidate = registry.get(updated).candidates()[0]
+    assert (candidate["endpoint"], candidate["key"], candidate["quota"]) == ("https://new/", "NEW", {"tpm": 1000})
+
+
+def test_registry_keeps_health_when_only_other_fields_change():
+    registry = RouterRegistry()
+    config = {"model_name": "m", "api-version": "v1", "key": "k", "endpoints": regions(), "model_info": "<p>old</p>"}
+    router = registry.get(config)
+    router.failure(router.configs[0])
+    updated = registry.get({**config, "api-version": "v2", "model_info": "<p>new</p>"})
+    assert updated is router
+    assert all(candidate["api-version"] == "v2" for candidate in updated.candidates())
+    assert router.stats()["https://east//d"]["error_rate"] > 0
+    assert list(registry.stats()) == ["m"]
+
+
+def test_registry_rebuilds_when_a_region_changes():
+    registry = RouterRegistry()
+    config = {"model_name": "m", "api-version": "v1", "key": "k", "endpoints": regions()}
+    router = registry.get(config)
+    assert registry.get(config) is router
+    moved = [{**regions()[0], "weight": 5}, regions()[1]]
+    assert registry.get({**config, "endpoints": moved}) is not router
+    assert registry.get({**config, "routing": {"cooldown": 5}}) is not router
@@ -0,0 +1,39 @@
+from ChatGPT_Web.session_store import SessionStore
+
+
+def test_turns_are_appended_and_loaded_per_user_and_model(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path)
+    store.append_turn("alice", "m", [{"role": "user", "content": "q1"}, {"role": "assistant", "content": "a1"}], ("q1", "a1"))
+    store.append_turn("alice", "m", [{"role": "user", "content": "q2"}, {"role": "assistant", "content": "a2"}], ("q2", "a2"))
+    store.append_turn("alice", "other", [{"role": "user", "content": "x"}], ("x", "y"))
+    store.append_turn("bob", "m", [{"role": "user", "content": "b"}], ("b", "c"))
+    messages, history = SessionStore(path).load("alice", "m")  # 重新開啟資料庫後仍可讀取
+    assert [message["content"] for message in messages] == ["q1", "a1", "q2", "a2"]
+    assert history == [("q1", "a1"), ("q2", "a2")]
+
+
+def test_load_returns_the_most_recent_turns_in_order(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    for index in range(5):
+        store.append_turn("alice", "m", [{"role": "user", "content": str(index)}], (str(index), ""))
+    _, history = store.load("alice", "m", limit=2)
+    assert history == [("3", ""), ("4", "")]
+
+
+def test_images_are_not_written_to_the_database(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    content = [{"type": "image_url", "image_url": "data:image/jpeg;base64,AAAA"}, {"type": "text", "text": "what?"}]
+    store.append_turn("alice", "m", [{"role": "user", "content": content}], ({"text": "what?", "files": ["a.png"]}, "a cat"))
+    messages, history = store.load("alice", "m")
+    assert messages[0]["content"] == [{"type": "text", "text": "[image]"}, {"type": "text", "text": "what?"}]
+    assert history == [({"text": "what?", "files": ["a.png"]}, "a cat")]
+
+
+def test_clear_only_removes_one_model(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    store.append_turn("alice", "m", [{"role": "user", "content": "q"}], ("q", "a"))
+    store.append_turn("alice", "other", [{"role": "user", "content": "q"}], ("q", "a"))
+    store.clear("alice", "m")
+    assert store.load("alice", "m") == ([], [])
+    assert store.load("alice", "other")[1] == [("q", "a")]
@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import pytest
+
+from ChatGPT_Web.streaming import ActiveStreams, StreamEvent, acoalesce
+
+
+async def _events(items):
+    for delay, text in items:
+        await asyncio.sleep(delay)
+        yield StreamEvent("delta", text)
+
+
+async def _collect(events, **kwargs):
+    started = time.monotonic()
+    return [(text, time.monotonic() - started) async for text in acoalesce(events, **kwargs)]
+
+
+def test_coalesce_merges_bursts_and_flushes_on_size():
+    out = asyncio.run(_collect(_events([(0, "a")] * 5 + [(0, "bcdef")]), interval=10, max_chars=4))
+    assert [text for text, _ in out] == ["aaaa", "abcdef"]
+
+
+def test_coalesce_flushes_buffer_while_upstream_is_slow():
+    # 短暫的爆發後下一個token很慢，已收到的文字仍應在 interval 到期時輸出
+    out = asyncio.run(_collect(_events([(0, "a"), (0, "b"), (0.5, "c")]), interval=0.05))
+    assert [text for text, _ in out] == ["ab", "c"]
+    assert out[0][1] < 0.3
+
+
+def test_coalesce_closes_upstream_when_consumer_stops():
+    closed = []
+
+    async def events():
+        try:
+            yield StreamEvent("delta", "a")
+            await asyncio.sleep(10)
+            yield StreamEvent("delta", "b")
+        finally:
+            closed.append(True)
+
+    async def main():
+        stream = acoalesce(events(), interval=0.01)
+        assert await stream.__anext__() == "a"
+        await stream.aclose()
+
+    asyncio.run(asyncio.wait_for(main(), 2))
+    assert closed == [True]
+
+
+def test_new_stream_cancels_the_previous_one_after_its_cleanup():
+    streams = ActiveStreams()
+    log = []
+
+    async def handler(name, delay):
+        async with streams.track(("alice", "m"), "s1"):
+            log.append(f"{name} start")
+            try:
+                await asyncio.sleep(delay)
+                log.append(f"{name} done")
+            finally:
+                await asyncio.sleep(0.05)  # 例如關閉上游的連線
+                log.append(f"{name} cleanup")
+        return name
+
+    async def main():
+        first = asyncio.ensure_future(handler("first", 10))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(handler("second", 0))
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(main()) == ["first", "second"]  # 被取代的串流正常結束
+    assert log == ["first start", "first cleanup", "second start", "second done", "second cleanup"]
+
+
+def test_other_cancellations_still_propagate():
+    streams = ActiveStreams()
+
+    async def handler():
+        async with streams.track(("alice", "m")):
+            await asyncio.sleep(10)
+
+    async def main():
+        task = asyncio.ensure_future(handler())
+        await asyncio.sleep(0.01)
+        task.cancel()  # 例如停止按鈕
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert streams._streams == {}
+
+    asyncio.run(main())
+
+
+def test_cancel_session_only_stops_that_page():
+    streams = ActiveStreams()
+
+    async def handler(key, session):
+        async with streams.track(key, session):
+            await asyncio.sleep(0.2)
+        return asyncio.current_task().cancelling() == 0
+
+    async def main():
+        closed = asyncio.ensure_future(handler(("alice", "a"), "s1"))
+        also_closed = asyncio.ensure_future(handler(("alice", "b"), "s1"))
+        other = asyncio.ensure_future(handler(("bob", "a"), "s2"))
+        await asyncio.sleep(0.01)
+        assert streams.cancel_session("s1") == 2
+        started = time.monotonic()
+        assert await asyncio.gather(closed, also_closed) == [True, True]
+        assert time.monotonic() - started < 0.1
+        assert not other.done()
+        await other
+
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+import asyncio
+
+from ChatGPT_Web.client_pool import client_registry
+from ChatGPT_Web.file_store import UploadCache
+from ChatGPT_Web.mock_azure import MockAzureServer
+
+
+def _upload(cache, server, paths, endpoint=None):
+    config = {"endpoint": endpoint or server.endpoint}
+
+    async def main():
+        client = client_registry.get_async(server.endpoint, "2024-02-15-preview", "k")
+        return await asyncio.gather(*(cache.upload(client, config, path) for path in paths))
+
+    return asyncio.run(main())
+
+
+def test_same_content_is_uploaded_once(tmp_path):
+    first, copy, other = tmp_path / "a.csv", tmp_path / "b.csv", tmp_path / "c.csv"
+    first.write_text("1,2,3")
+    copy.write_text("1,2,3")
+    other.write_text("4,5,6")
+    cache = UploadCache()
+    with MockAzureServer() as server:
+        ids = _upload(cache, server, [first, copy, other, first])
+        assert ids[0] == ids[1] == ids[3] != ids[2]
+        assert _upload(cache, server, [copy]) == [ids[0]]
+        # 檔案不會在不同的資源之間共用
+        assert _upload(cache, server, [copy], endpoint="https://other/") != [ids[0]]
+
+
+def test_least_recently_used_entries_are_dropped(tmp_path):
+    paths = []
+    for index in range(3):
+        path = tmp_path / f"{index}.txt"
+        path.write_text(str(index))
+        paths.append(path)
+    cache = UploadCache(max_entries=2)
+    with MockAzureServer() as server:
+        first, = _upload(cache, server, [paths[0]])
+        second, = _upload(cache, server, [paths[1]])
+        assert _upload(cache, server, [paths[0]]) == [first]
+        _upload(cache, server, [paths[2]])
+        assert _upload(cache, server, [paths[0]]) == [first]
+        assert _upload(cache, server, [paths[1]]) != [second]  # 最久未使用的紀錄已被移除
@@ -0,0 +1,55 @@
+import types
+
+from ChatGPT_Web import user_registry
+from ChatGPT_Web.user_registry import UserRegistry, approx_size
+
+
+def make_registry(**kwargs):
+    created = []
+
+    def factory(username):
+        user = types.SimpleNamespace(username=username, memory_usage=lambda: 10)
+        created.append(username)
+        registry[username] = user
+        return user
+
+    registry = UserRegistry(factory, **kwargs)
+    return registry, created
+
+
+def test_evicts_least_recently_used():
+    registry, _ = make_registry(max_users=2)
+    registry["a"] = types.SimpleNamespace()
+    registry["b"] = types.SimpleNamespace()
+    registry["a"]  # a 變為最近使用
+    registry["c"] = types.SimpleNamespace()
+    assert "a" in registry and "c" in registry and "b" not in registry
+    assert registry.evicted == 1
+
+
+def test_missing_user_is_rebuilt_by_factory():
+    registry, created = make_registry()
+    user = registry["nick"]
+    assert registry["nick"] is user
+    assert created == ["nick"]
+
+
+def test_evict_idle(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(user_registry.time, "monotonic", lambda: clock[0])
+    registry, _ = make_registry(idle_ttl=60)
+    registry["a"] = types.SimpleNamespace()
+    clock[0] += 30
+    registry["b"] = types.SimpleNamespace()
+    clock[0] += 40
+    assert registry.evict_idle() == ["a"]
+    assert len(registry) == 1
+
+
+def test_stats_and_approx_size():
+    registry, _ = make_registry()
+    registry["nick"]
+    stats = registry.stats()
+    assert stats["active_users"] == 1 and stats["total_bytes"] == 10
+    shared = ["x" * 1000]
+    assert approx_size([shared, shared]) < 2 * approx_size(shared)
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+litellm = pytest.importorskip("litellm")
+
+from ChatGPT_Web.call_gpt import ChatGPT
+from ChatGPT_Web.mock_azure import _png
+
+
+class _BadRequest(Exception):
+    status_code = 400
+
+
+def _vision(stream=True):
+    return {"model_name": "GPT-4 Vision", "endpoint": "https://vision/", "key": "k", "deployment": "d",
+            "api-version": "2023-12-01-preview", "cv_endpoint": "https://cv/", "cv_key": "k", "stream": stream}
+
+
+def _run(monkeypatch, tmp_path, error, stream=True):
+    calls = []
+
+    async def acompletion(stream=False, **kwargs):
+        calls.append(stream)
+        if stream and error is not None:
+            raise error
+        return {"choices": [{"message": {"content": "a cat"}, "finish_reason": "stop"}]}
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    image = tmp_path / "cat.png"
+    image.write_bytes(_png())
+
+    async def main():
+        events = ChatGPT(_vision(stream)).aget_response("what is this?", 100, "u", [str(image)], delta=True)
+        return [event async for event in events]
+
+    return calls, asyncio.run(main())
+
+
+def test_falls_back_when_streaming_is_unsupported(monkeypatch, tmp_path):
+    calls, events = _run(monkeypatch, tmp_path, _BadRequest("The stream parameter is not supported."))
+    assert calls == [True, False]
+    assert [event.content for event in events if event.type == "delta"] == ["a cat"]
+
+
+def test_other_errors_are_not_sent_again(monkeypatch, tmp_path):
+    calls, events = _run(monkeypatch, tmp_path, _BadRequest("The response was filtered by the content filter."))
+    assert calls == [True]
+    assert events[-1].type == "error"
+
+
+def test_stream_disabled_in_config(monkeypatch, tmp_path):
+    calls, events = _run(monkeypatch, tmp_path, None, stream=False)
+    assert calls == [False]
+    assert events[-1].data == {"finish_reason": "stop"}
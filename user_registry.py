@@ -0,0 +1,137 @@
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+
+def approx_size(obj, _seen=None):
+    """粗略估算物件佔用的記憶體位元組數，只遞迴計算容器與字串。
+
+    Args:
+        obj: 要估算的物件。
+
+    Returns:
+        int: 估算的位元組數。
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(key, _seen) + approx_size(value, _seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(approx_size(item, _seen) for item in obj)
+    return size
+
+
+class UserRegistry:
+    def __init__(self, factory, max_users=200, idle_ttl=3600, sweep_interval=60):
+        """有上限的使用者註冊表，超過上限時移除最久未使用的使用者，閒置過久的使用者也會被移除。
+
+        被移除的使用者下次發送請求時會重新建立，對話紀錄再從 SessionStore 載入。
+
+        Args:
+            factory (callable): 以用戶名建立使用者的函式，用於重新建立被移除的使用者。
+            max_users (int): 同時保留在記憶體中的使用者上限。
+            idle_ttl (float): 使用者閒置超過此秒數後移除。
+            sweep_interval (float): 背景檢查閒置使用者的間隔秒數。
+        """
+        self.factory = factory
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.evicted = 0
+        self._users = OrderedDict()
+        self._last_seen = {}
+        self._lock = threading.RLock()
+        self._sweeper = None
+
+    def __getitem__(self, username):
+        with self._lock:
+            user = self._users.get(username)
+            if user is not None:
+                self._users.move_to_end(username)
+                self._last_seen[username] = time.monotonic()
+                return user
+        # 已被移除的使用者重新建立，factory 會透過 __setitem__ 加入註冊表
+        return self.factory(username)
+
+    def __setitem__(self, username, user):
+        with self._lock:
+            self._users[username] = user
+            self._users.move_to_end(username)
+            self._last_seen[username] = time.monotonic()
+            while len(self._users) > self.max_users:
+                oldest, _ = self._users.popitem(last=False)
+                self._last_seen.pop(oldest, None)
+                self.evicted += 1
+
+    def __contains__(self, username):
+        return username in self._users
+
+    def __len__(self):
+        return len(self._users)
+
+    def pop(self, username, default=None):
+        with self._lock:
+            self._last_seen.pop(username, None)
+            return self._users.pop(username, default)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._last_seen.clear()
+
+    def items(self):
+        with self._lock:
+            return list(self._users.items())
+
+    def evict_idle(self):
+        """移除閒置超過 idle_ttl 的使用者。
+
+        Returns:
+            list: 被移除的用戶名。
+        """
+        deadline = time.monotonic() - self.idle_ttl
+        with self._lock:
+            idle = [username for username, seen in self._last_seen.items() if seen < deadline]
+            for username in idle:
+                self.pop(username)
+            self.evicted += len(idle)
+        return idle
+
+    def start_sweeper(self):
+        """啟動背景執行緒定期移除閒置的使用者。"""
+        if self._sweeper is not None:
+            return
+
+        def _sweep():
+            while True:
+                time.sleep(self.sweep_interval)
+                self.evict_idle()
+
+        self._sweeper = threading.Thread(target=_sweep, name="user-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stats(self):
+        """統計目前使用者的數量與估算的記憶體用量，供管理者查看。
+
+        Returns:
+            dict: 使用者數量、已移除的數量、總記憶體與每位使用者的記憶體及閒置秒數。
+        """
+        now = time.monotonic()
+        users = {}
+        for username, user in self.items():
+            users[username] = {
+                "bytes": user.memory_usage(),
+                "idle_seconds": round(now - self._last_seen.get(username, now)),
+            }
+        return {
+            "active_users": len(users),
+            "max_users": self.max_users,
+            "evicted_users": self.evicted,
+            "total_bytes": sum(item["bytes"] for item in users.values()),
+            "users": users,
+        }
@@ -1,8 +1,23 @@
+import asyncio
+from collections import deque
+from contextlib import aclosing
 import json
-import time
 import os
+import secrets
+import time
 import gradio as gr
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
 from ChatGPT_Web.call_gpt import ChatGPT
+from ChatGPT_Web.client_pool import client_registry
+from ChatGPT_Web.config_store import ConfigStore
+from ChatGPT_Web.file_store import StorageQuotaExceeded, file_store
+from ChatGPT_Web.image_store import image_store
+from ChatGPT_Web.metrics import registry as metrics_registry
+from ChatGPT_Web.router import router_registry
+from ChatGPT_Web.session_store import SessionStore
+from ChatGPT_Web.user_registry import UserRegistry, approx_size
+from ChatGPT_Web.streaming import ActiveStreams, acoalesce
 
 class User:
     def __init__(self, name, ip):
@@ -22,35 +37,73 @@ class User:
         self.system_message = None
         self.max_tokens = None
         self.download_path = None
-        self.dalle_index = 0
+        self.dalle_history = deque()  # 圖庫中的 (縮圖路徑, 原圖路徑, 提示)，由 WebBot 設定為依用戶名共用的圖庫
+        self.restored = set()  # 已從保存的紀錄載入對話的模型
+
+    def memory_usage(self):
+        """估算此使用者的對話狀態佔用的記憶體位元組數。
+
+        Returns:
+            int: 估算的位元組數。
+        """
+        size = approx_size(self.chat_history) + approx_size(self.system_message_dict) + approx_size(list(self.dalle_history))
+        for chatgpt in (self.chatgpt or {}).values():
+            size += approx_size(chatgpt.messages) + approx_size(getattr(chatgpt, "transcript", []))
+        return size
 
 class WebBot:
-    def __init__(self, config_path='model_config.json', web_name='Nick GPT', web_server=None):
+    def __init__(self, config_path='model_config.json', web_name='Nick GPT', web_server=None, stream_interval=0.05, stream_max_chars=256, concurrency_limit=100, session_path='sessions.db', max_users=200, idle_ttl=3600, max_history=200, user_config_path='user_config.json', max_gallery=30, metrics_token=None):
         """初始化WebBot的配置並加載模型。
 
         Args:
             config_path (str): 模型配置檔案的路徑。
             web_name (str): 網站的名稱。
             web_server (Optional[bool]): 是否運行在web服務器模式。
+            stream_interval (float): 串流輸出時兩次推送前端的最短間隔秒數。
+            stream_max_chars (int): 串流輸出累積超過此字數時立即推送前端。
+            concurrency_limit (int): 每個對話頁面同時處理的請求數，處理函式皆為非同步，可設定較大的值。
+            session_path (str): 保存使用者對話紀錄的SQLite檔案路徑。
+            max_users (int): 同時保留在記憶體中的使用者上限。
+            idle_ttl (float): 使用者閒置超過此秒數後從記憶體移除。
+            max_history (int): 每個模型在記憶體中保留的聊天紀錄輪數，完整紀錄保存在 session_path。
+            user_config_path (str): 用戶配置檔案的路徑。
+            max_gallery (int): 每位使用者圖庫保留的圖片數量上限。
+            metrics_token (str, optional): 存取 /metrics 的 Bearer token，未設定時只允許本機存取。
         """
         self.config_path = config_path
         self.web_name = web_name
         self.web_server = web_server
+        self.stream_interval = stream_interval
+        self.stream_max_chars = stream_max_chars
+        self.concurrency_limit = concurrency_limit
+        self.streams = ActiveStreams()  # 使用者進行中的串流，新的提問或關閉頁面時取消
+        self.session_store = SessionStore(session_path)
+        self.max_history = max_history
+        self.max_gallery = max_gallery
+        self.metrics_token = metrics_token
+        self._warm_task = None
+        self.galleries = {}  # 依用戶名保存的圖庫，重新載入頁面或使用者被移除後仍保留
+        # 被移除的使用者在下次請求時重新建立，對話紀錄再從 session_store 載入
+        self.user = UserRegistry(lambda username: self.new_user_setting(username, None), max_users, idle_ttl)
+        self.user.start_sweeper()
+        file_store.start_sweeper()
+        image_store.start_sweeper()
+        # 用戶配置保存在記憶體中，修改延遲寫回，檔案被外部修改時自動重新讀取
+        self.config_store = ConfigStore(user_config_path)
+        self.config_store.on_reload(self.reload_users)
+        self.config_store.start_watcher()
         self.init_setting()
 
     def init_setting(self):
         """初始化設定，加載用戶和系統訊息配置文件。"""
-        self.user = {}
+        self.user.clear()
 
         # 讀取模型列表配置
         with open(self.config_path, 'r', encoding='utf-8') as f:
             self.model_list = json.load(f)
 
-        # 讀取用戶配置文件
-        with open('user_config.json', 'r', encoding='utf-8') as f:
-            self.user_config = json.load(f)
-            self.user_list = self.user_config[0]
-            self.system_message = self.user_config[1]['nick']
+        # 讀取用戶配置
+        self.system_message = self.config_store.system_messages('nick')
 
         # 建立系統訊息列表
         self.system_message_list = [(key, value) for key, value in self.system_message.items()]
@@ -66,7 +119,8 @@ class WebBot:
             "role": "system",
             "content": (self.system_message["Assistants"])
         }
-        
+
+
         # 根據模型配置創建ChatGPT實例
         self.chatgpt = {
             config["model_name"]: ChatGPT(config, self.init_system)
@@ -83,6 +137,55 @@ class WebBot:
             model["model_name"] for model in self.model_list
         ]
 
+    def reload_setting(self):
+        """重新讀取模型與用戶配置，只重建有變更的部署與使用者，其他使用者的對話保持不變。"""
+        with open(self.config_path, 'r', encoding='utf-8') as f:
+            model_list = json.load(f)
+        old_configs = {config["model_name"]: config for config in self.model_list}
+        new_configs = {config["model_name"]: config for config in model_list}
+        changed = [name for name, config in new_configs.items() if old_configs.get(name) != config]
+        removed = [name for name in old_configs if name not in new_configs]
+        self.model_list = model_list
+        self.model_deployment_list = [model["model_name"] for model in model_list]
+
+        for name in changed:
+            self.chatgpt[name] = ChatGPT(new_configs[name], self.init_system)
+            self.chat_history.setdefault(name, [])
+        for name in removed:
+            self.chatgpt.pop(name, None)
+            self.chat_history.pop(name, None)
+
+        for username, user in self.user.items():
+            for name in changed:
+                if name in user.chatgpt:
+                    user.chatgpt[name].update_config(new_configs[name])
+                else:
+                    user.chatgpt[name] = ChatGPT(new_configs[name], {"role": "system", "content": user.system_message_dict["default"]})
+                    user.chat_history[name] = []
+            for name in removed:
+                user.chatgpt.pop(name, None)
+                user.chat_history.pop(name, None)
+            user.model_deployment_list = self.model_deployment_list
+
+        self.config_store.reload()
+        self.reload_users()
+
+    def reload_users(self):
+        """用戶配置變更後更新線上使用者的系統訊息，並移除已刪除的使用者。"""
+        self.system_message = self.config_store.system_messages('nick')
+        self.system_message_list = [(key, value) for key, value in self.system_message.items()]
+        self.init_system = {"role": "system", "content": self.system_message["default"]}
+        self.init_assistants_system = {"role": "system", "content": self.system_message["Assistants"]}
+        for username, user in self.user.items():
+            if not self.config_store.has_user(username):
+                self.user.pop(username)
+                self.galleries.pop(username, None)
+                continue
+            system_message_dict = self.config_store.system_messages(username)
+            if system_message_dict != user.system_message_dict:
+                user.system_message_dict = system_message_dict
+                user.system_message_list = [(key, value) for key, value in system_message_dict.items()]
+
     def new_user_setting(self, username, ip):
         """為新用戶建立配置並儲存到用戶字典中。
 
@@ -94,9 +197,9 @@ class WebBot:
             User: 初始化完成的用戶對象。
         """
         new_user = User(username, ip)
+        new_user.dalle_history = self.galleries.setdefault(username, deque(maxlen=self.max_gallery))
         # 讀取用戶專屬的系統消息配置
-        with open('user_config.json', 'r', encoding='utf-8') as f:
-            new_user.system_message_dict = json.load(f)[1][username]
+        new_user.system_message_dict = self.config_store.system_messages(username)
         new_user.system_message_list = [(key, value) for key, value in new_user.system_message_dict.items()]
         
         # 設定初始系統消息
@@ -125,23 +228,69 @@ class WebBot:
         return new_user
     
     def auth_user(self, username, password):
-        if username in self.user_list.keys():
-            if self.user_list[username] == password:
-                return True  
-        return False
+        return self.config_store.check_password(username, password)
     
-    def dalle(self, prompt, Image_size, Image_style, Image_Quality, image_1, image_2, image_3, image_4, image_5
-              , image_6, image_7, image_8, image_9, image_10, request: gr.Request):
-        response, image_url = self.user[request.username].chatgpt["Dall-E-3"].get_image(prompt, Image_size, Image_style, Image_Quality, request.username)
-        image_list = [image_1, image_2, image_3, image_4, image_5, image_6, image_7, image_8, image_9, image_10]
-        image_list[self.user[request.username].dalle_index] = gr.Image(value=image_url, label=prompt, height=512, show_label=True, visible=True)
-        if self.user[request.username].dalle_index+1 == len(image_list):
-            self.user[request.username].dalle_index = 0
+    def metrics(self, request: Request):
+        """以 Prometheus 文字格式輸出延遲、吞吐量與配額相關的指標。
+
+        /metrics 不經過 Gradio 的登入驗證，設定 metrics_token 時需以 Authorization: Bearer 標頭存取，否則只允許本機存取。
+
+        Args:
+            request (Request): FastAPI 的請求對象。
+        """
+        if self.metrics_token:
+            authorized = secrets.compare_digest(request.headers.get("authorization", ""), f"Bearer {self.metrics_token}")
         else:
-            self.user[request.username].dalle_index += 1
-        return [response]+image_list
+            authorized = request.client is not None and request.client.host in ("127.0.0.1", "::1")
+        if not authorized:
+            return PlainTextResponse("Forbidden", status_code=403)
+        return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
+    def gallery_value(self, username):
+        """以縮圖組成使用者的圖庫內容，最新的圖片排在最前面。"""
+        history = self.user[username].dalle_history
+        # 已被圖片快取清理的圖片從圖庫移除
+        for item in [item for item in history if not os.path.exists(item[1])]:
+            history.remove(item)
+        return [(thumbnail, caption) for thumbnail, _, caption in reversed(history)]
 
+    async def dalle(self, prompt, Image_size, Image_style, Image_Quality, Image_count, request: gr.Request):
+        """生成圖片並加入使用者在伺服器端保存的圖庫。
+
+        圖庫只回傳縮圖的路徑，原圖只回傳最新的一張，不再往返傳送所有圖片。
+
+        Returns:
+            tuple: 修正後的提示、更新後的圖庫與最新的原圖。
+        """
+        user = self.user[request.username]
+
+        def announce(wait):
+            # 與文字對話相同，等待部署配額時通知使用者預計的等待時間
+            gr.Info(f"Waiting for quota, about {wait:.0f} seconds")
+
+        results = await user.chatgpt["Dall-E-3"].aget_images(prompt, Image_size, Image_style, Image_Quality, request.username, int(Image_count), announce)
+        revised_prompts = []
+        latest = gr.Image()  # 沒有成功生成時保持原本的圖片
+        for response, image_path in results:
+            revised_prompts.append(str(response))
+            if image_path is None:
+                continue
+            thumbnail = await image_store.thumbnail(image_path)  # 已產生過的縮圖直接回傳
+            user.dalle_history.append((thumbnail, image_path, prompt))
+            latest = gr.Image(value=image_path, label=prompt)
+        return "\n\n".join(dict.fromkeys(revised_prompts)), self.gallery_value(request.username), latest
+
+    def select_image(self, evt: gr.SelectData, request: gr.Request):
+        """點選圖庫中的縮圖時顯示對應的原圖。"""
+        history = list(reversed(self.user[request.username].dalle_history))
+        if evt.index >= len(history):
+            return gr.Image()
+        _, image_path, caption = history[evt.index]
+        return gr.Image(value=image_path, label=caption)
+
+    def load_gallery(self, request: gr.Request):
+        """頁面載入時還原使用者的圖庫。"""
+        return self.gallery_value(request.username)
 
     def delete_system_message(self, system_message, sys_message_select, request: gr.Request):
         """從用戶配置中刪除特定的系統消息。
@@ -154,14 +303,11 @@ class WebBot:
         Returns:
             tuple: 更新後的系統消息 widgets。
         """
-        del self.user_config[1][request.username][sys_message_select]
-        # 更新設定文件
-        with open('user_config.json', 'w', encoding='utf-8') as f:
-            json.dump(self.user_config, f, ensure_ascii=False, indent=4)
+        # 更新設定，檔案會在背景寫回
+        self.user[request.username].system_message_dict = self.config_store.delete_system_message(request.username, sys_message_select)
         
         gr.Info("Delete")
         
-        self.user[request.username].system_message_dict = self.user_config[1][request.username]
         self.user[request.username].system_message_list = [(key, value) for key, value in self.user[request.username].system_message_dict.items()]
         
         # 創建更新後的下拉選擇器
@@ -191,9 +337,8 @@ class WebBot:
         Returns:
             tuple: 更新後的系統消息下拉選項控件。
         """
-        # 更新用戶配置並保存到檔案
-        self.user_config[1][request.username][system_message_name] = system_message
-        self.user[request.username].system_message_dict[system_message_name] = system_message
+        # 更新用戶配置，檔案會在背景寫回
+        self.user[request.username].system_message_dict = self.config_store.set_system_message(request.username, system_message_name, system_message)
         self.user[request.username].system_message = system_message
         self.user[request.username].system_message_list = [(key, value) for key, value in self.user[request.username].system_message_dict.items()]
         
@@ -206,13 +351,14 @@ class WebBot:
         )
         
         gr.Info("Saved")
-        
-        # 將更新寫回配置文件
-        with open('user_config.json', 'w', encoding='utf-8') as f:
-            json.dump(self.user_config, f, ensure_ascii=False, indent=4)
 
         return sys_message_select, sys_message_select, sys_message_select, sys_message_select
     
+    async def warm_up_clients(self):
+        """在服務請求的事件迴圈中於背景預熱各部署的連線，新增或變更的部署在重新載入頁面時預熱。"""
+        if self._warm_task is None or self._warm_task.done():
+            self._warm_task = asyncio.ensure_future(client_registry.warm_up(self.model_list))
+
     def get_request_ip(self, sys_message_select, request: gr.Request):
         """處理來自Gradio前端的請求，獲取請求用戶的IP並初始化設置。
 
@@ -289,12 +435,14 @@ class WebBot:
             list: 更新後的聊天組件列表。
         """
         if model_select == "Assistants":  # 特定模型可能需要重置較多資源
-            # 重新創建相關助理實例，并重置相關數據
-            self.user[request.username].client, self.user[request.username].assistant, self.user[request.username].thread = self.user[request.username].create_assistant()
+            # 捨棄使用者的線程，助手本身由所有使用者共用不需重建
+            self.user[request.username].chatgpt[model_select].reset_thread()
         else:
             # 對其他模型進行聊天記錄的清空
             self.user[request.username].chatgpt[model_select].messages = []
-            self.user[request.username].chat_history[model_select] = []
+        self.user[request.username].chat_history[model_select] = []
+        self.user[request.username].restored.add(model_select)
+        self.session_store.clear(request.username, model_select)  # 一併刪除保存的對話紀錄
         chatbot = []  # 清空聊天機器人顯示組件
         return chatbot  # 返回更新後的聊天機器人組件
     
@@ -337,7 +485,40 @@ class WebBot:
                 gr.DownloadButton("Download file", variant="primary", interactive=False)  # 保持下載按鈕為不可交互狀態
             ]
         
-    def assistant_echo(self, message, history, model, use_model, sys_message, request: gr.Request):
+    async def restore_session(self, user, model):
+        """使用者第一次使用某個模型時，才從保存的紀錄載入該模型的對話。
+
+        Args:
+            user (User): 使用者。
+            model (str): 模型名稱。
+        """
+        if model in user.restored:
+            return
+        user.restored.add(model)
+        messages, history = await asyncio.to_thread(self.session_store.load, user.username, model)
+        if not history:
+            return
+        chatgpt = user.chatgpt[model]
+        if model == "Assistants":
+            chatgpt.transcript = messages  # 新的線程會帶入先前的對話
+        else:
+            chatgpt.messages = chatgpt.messages[:1] + messages  # 保留目前的系統訊息
+        user.chat_history[model] = history + user.chat_history[model]
+
+    async def save_turn(self, user, model, message, response):
+        """將剛完成的一輪對話追加到保存的紀錄。
+
+        Args:
+            user (User): 處理這次請求的使用者，串流期間被移出註冊表時仍使用同一個物件。
+            model (str): 模型名稱。
+            message (dict): 使用者的提問。
+            response (str): 模型的回答。
+        """
+        turn = user.chatgpt[model].last_turn
+        if turn:
+            await asyncio.to_thread(self.session_store.append_turn, user.username, model, turn, (message, response))
+
+    async def assistant_echo(self, message, history, model, use_model, sys_message, request: gr.Request):
         """處理和回應用戶的互動，包括檔案的處理和文字的反饋。
 
         Args:
@@ -348,44 +529,99 @@ class WebBot:
             sys_message (str): 系統訊息。
             request (gr.Request): 包含用戶信息的請求對象。
 
-        Returns:
-            list: 更新後的聊天歷史。
+        Yields:
+            str: 目前為止累積的回應。
         """
-        history = self.user[request.username].chat_history[model]
+        user = self.user[request.username]  # 只查詢一次，串流期間使用者被移除也不影響這次對話
+        await self.restore_session(user, model)
+        history = user.chat_history[model]
         question = message['text']
         if len(message['files']) > 0:
-            file_path = message['files'][0]
-            file = self.user[request.username].chatgpt[model].upload_file(file_path)
+            # 所有附件同時上傳，已上傳過的檔案直接沿用
+            file = await user.chatgpt[model].aupload_files(message['files'], use_model)
         else:
             file = []
         response = ""
         output_file = True  # 標記是否需要處理文件輸出
-        for text_output, file_id, file_type, file_path in self.user[request.username].chatgpt[model].assistant_stream_output(question, file, use_model, sys_message):
-            if text_output:
-                response += text_output
-                yield response
-            if file_id and file_type and output_file:
-                content = self.user[request.username].chatgpt[model].client.files.content(file_id)
-                if file_type == "image":
-                    save_file_name = os.path.join(os.path.dirname(__file__), 'image', file_id + '.png')
-                    image = content.write_to_file(save_file_name)
-                else:
-                    output_file_object = self.user[request.username].chatgpt[model].client.files.retrieve(file_id)
-                    save_file_name = os.path.join(os.path.dirname(__file__), 'image', output_file_object.filename.split("/")[-1])
-                    with open(save_file_name, "wb") as file:
-                        file.write(self.user[request.username].chatgpt[model].client.files.content(file_id).read())
-                self.user[request.username].download_path = save_file_name
-                if response.endswith("```"):
-                    response += '\n\n'
-                else:
-                    response += '\n```\n\n'
-                output_file = False
-                yield response
+        downloads = {}  # file_id 與背景下載的 Task，下載時文字串流不會中斷
+        requested = set()
+        chatgpt = user.chatgpt[model]
+        async with self.streams.track((request.username, model), request.session_hash):
+            try:
+                events = chatgpt.aassistant_stream_output(question, file, use_model, sys_message)
+                async with aclosing(events):  # 中斷時一併關閉上游的串流並取消 run
+                    async for text_output, file_id, file_type, file_path in events:
+                        if text_output:
+                            response += text_output
+                            yield response
+                        if file_id and file_type and file_id not in requested:
+                            requested.add(file_id)
+                            client = client_registry.get_async_for(chatgpt.model_config[chatgpt.use_model])
+                            # 串流寫入使用者的資料夾，同一個檔案只下載一次
+                            downloads[file_id] = asyncio.ensure_future(file_store.fetch(request.username, client, file_id, file_type))
+                            if output_file:
+                                if response.endswith("```"):
+                                    response += '\n\n'
+                                else:
+                                    response += '\n```\n\n'
+                                output_file = False
+                                yield response
+                        self.attach_downloads(user, downloads)
+                if downloads:
+                    await asyncio.wait(downloads.values())
+                    self.attach_downloads(user, downloads)
+            finally:
+                for task in downloads.values():
+                    task.cancel()  # 對話被中斷時不再等待，已開始的下載仍會完成並保存
         history.append((message, response))
-        self.user[request.username].chat_history[model] = history
-        return history
+        user.chat_history[model] = history[-self.max_history:]
+        await self.save_turn(user, model, message, response)
     
-    def slow_echo(self, message, history, model, max_tokens, system_message, request: gr.Request):
+    async def cancel_streams(self, request: gr.Request):
+        """使用者關閉頁面時取消該頁面進行中的串流，釋放上游的連線與配額。
+
+        Args:
+            request (gr.Request): 包含 session 的請求對象。
+        """
+        self.streams.cancel_session(request.session_hash)
+
+    def attach_downloads(self, user, downloads):
+        """將已完成的背景下載設為使用者可下載的檔案，並通知使用者。
+
+        Args:
+            user (User): 處理這次請求的使用者，串流期間被移出註冊表時仍使用同一個物件。
+            downloads (dict): file_id 與下載的 Task，處理過的項目會被移除。
+        """
+        for file_id, task in list(downloads.items()):
+            if not task.done():
+                continue
+            del downloads[file_id]
+            if task.cancelled():
+                continue
+            if isinstance(task.exception(), StorageQuotaExceeded):
+                gr.Warning(str(task.exception()))
+            elif task.exception() is not None:
+                gr.Warning(f"Failed to download the file: {task.exception()}")
+            else:
+                user.download_path = task.result()
+                gr.Info("The file is ready, click \"Get file\" to download it")
+
+    async def announce_queue(self, events):
+        """在請求等待部署配額時通知使用者預計的等待時間。
+
+        Args:
+            events (async iterable): StreamEvent 的非同步迭代器。
+
+        Yields:
+            StreamEvent: 原本的事件。
+        """
+        async with aclosing(events):
+            async for event in events:
+                if event.type == "queue":
+                    gr.Info(f"Waiting for quota, about {event.data['wait']:.0f} seconds")
+                yield event
+
+    async def slow_echo(self, message, history, model, max_tokens, system_message, request: gr.Request):
         """處理接收到的訊息並透過GPT模型生成回答，然後返回一個生成回應的生成器。
 
         Args:
@@ -397,19 +633,25 @@ class WebBot:
             request (gr.Request): 包含用戶信息的請求對象。
 
         Yields:
-            str: 生成的單次回應。
+            str: 目前為止累積的回應。
         """
-        history = self.user[request.username].chat_history[model]
+        user = self.user[request.username]  # 只查詢一次，串流期間使用者被移除也不影響這次對話
+        await self.restore_session(user, model)
+        history = user.chat_history[model]
         question = message['text']
         image = message.get('files', None)  # 檢查是否有文件附帶
-        responses = self.user[request.username].chatgpt[model].get_response(question, max_tokens, request.username, image, system_message=system_message)
-        response = ""
-        for response_part in responses:
-            response += response_part
-            yield response_part
+        events = user.chatgpt[model].aget_response(question, max_tokens, request.username, image, system_message=system_message, delta=True)
+        parts = []
+        # 同一個頁面再次提問時中斷先前的回答，上游的連線會立即關閉
+        async with self.streams.track((request.username, model), request.session_hash):
+            # 合併增量後再推送，避免每個token都傳送一次完整的回應
+            async for text in acoalesce(self.announce_queue(events), self.stream_interval, self.stream_max_chars):
+                parts.append(text)
+                yield "".join(parts)
+        response = "".join(parts)
         history.append((message, response))
-        self.user[request.username].chat_history[model] = history
-        return history
+        user.chat_history[model] = history[-self.max_history:]
+        await self.save_turn(user, model, message, response)
     
     def run_web(self):
         """啟動Gradio網頁介面。"""
@@ -475,7 +717,7 @@ class WebBot:
                 x=gr.ChatInterface(fn=self.slow_echo,
                             chatbot=bot_list[0],
                             additional_inputs=[model_select[0], number, system_message_1],
-                            concurrency_limit=10,
+                            concurrency_limit=self.concurrency_limit,
                             multimodal=True).queue()
                 x.textbox.autoscroll = False
                 
@@ -528,7 +770,7 @@ class WebBot:
                 gr.ChatInterface(fn=self.slow_echo,
                             chatbot=bot_list[1],
                             additional_inputs=[model_select[1], number, system_message_2],
-                            concurrency_limit=10,
+                            concurrency_limit=self.concurrency_limit,
                             multimodal=True).queue()
                 
             with gr.Tab(self.model_list[2]["model_name"]): #gpt4-v
@@ -580,7 +822,7 @@ class WebBot:
                 gr.ChatInterface(fn=self.slow_echo,
                             chatbot=bot_list[2],
                             additional_inputs=[model_select[2], number, system_message_3],
-                            concurrency_limit=10,
+                            concurrency_limit=self.concurrency_limit,
                             multimodal=True).queue()
                 
             with gr.Tab(self.model_list[3]["model_name"]): #dall-e-3
@@ -593,15 +835,17 @@ class WebBot:
                         Image_size = gr.Radio(["1024x1024", "1024x1792"], value="1024x1024", label="Image size")
                         Image_style = gr.Radio(["vivid", "natural"], value="vivid", label="Image style")
                         Image_Quality = gr.Radio(["standard", "hd"], value="hd", label="Image Quality")
+                        Image_count = gr.Slider(1, 4, value=1, step=1, label="Number of images")
                     with gr.Column(scale=3):
                         with gr.Row(equal_height=True):
                             prompt = gr.Textbox(label="Prompt", placeholder="Describe the image you want to create.", autofocus=True, show_label=True, scale=2)
                             send_request = gr.Button("Generate", variant="primary", scale=0)
                         revised_prompt = gr.Textbox(label="Revised prompt", show_label=True, show_copy_button=True, scale=4)
                 with gr.Row(0, equal_height=True):
-                    image_list = []
-                    [image_list.append(gr.Image(visible=False)) for _ in range(10)]
-                    send_request.click(self.dalle, [prompt, Image_size, Image_style, Image_Quality]+image_list, [revised_prompt]+image_list)
+                    latest_image = gr.Image(label="Image", height=512, show_label=True, interactive=False, scale=3)
+                    gallery = gr.Gallery(label="Gallery", columns=3, height=512, preview=False, scale=2)
+                    send_request.click(self.dalle, [prompt, Image_size, Image_style, Image_Quality, Image_count], [revised_prompt, gallery, latest_image])
+                    gallery.select(self.select_image, None, latest_image)
 
             with gr.Tab(self.model_list[4]["model_name"]): #assistant
                 with gr.Row(equal_height=True):
@@ -647,15 +891,26 @@ class WebBot:
                 gr.ChatInterface(fn=self.assistant_echo,
                             chatbot=bot_list[4],
                             additional_inputs=[model_select[4], choose_model, system_message_4],
-                            concurrency_limit=5,
+                            concurrency_limit=self.concurrency_limit,
                             multimodal=True).queue()
                 get_file_btn.click(self.get_file, None, [get_file_btn, download_btn])
                 download_btn.click(self.download_file, None, [get_file_btn, download_btn])
             with gr.Tab("setting"):
                 logout_button = gr.Button("Logout", link="/logout")
                 refresh_btn = gr.Button(value="Refresh the page")
-            refresh_btn.click(self.init_setting, js="window.location.reload()")
-            demo.load(self.get_request_ip, [sys_message_select_1], [sys_message_select_1, sys_message_select_2, sys_message_select_3, sys_message_select_4])
+                with gr.Accordion("Server status", open=False):
+                    status_btn = gr.Button(value="Show memory usage")
+                    status_json = gr.JSON(label="Users")
+                    region_btn = gr.Button(value="Show endpoint health")
+                    region_json = gr.JSON(label="Endpoints")
+                status_btn.click(self.user.stats, None, status_json)
+                region_btn.click(router_registry.stats, None, region_json)
+            refresh_btn.click(self.reload_setting, js="window.location.reload()")
+            demo.unload(self.cancel_streams)
+            demo.load(self.warm_up_clients)
+            # 建立使用者之後才還原圖庫
+            demo.load(self.get_request_ip, [sys_message_select_1], [sys_message_select_1, sys_message_select_2, sys_message_select_3, sys_message_select_4]).then(
+                self.load_gallery, None, gallery)
 
             save_btn_1.click(self.save_system_message, [system_message_1, system_message_box_1], [sys_message_select_1, sys_message_select_2, sys_message_select_3])
             delete_btn_1.click(self.delete_system_message, [system_message_1, sys_message_select_1], [system_message_1, sys_message_select_1, sys_message_select_2, sys_message_select_3])
@@ -685,10 +940,14 @@ class WebBot:
                 inputs=[sys_message_select_4, system_message_4], 
                 outputs=[system_message_4])
 
+            # 先以不阻塞的方式啟動，掛上 /metrics 後再等待伺服器結束
+            # 使用者的檔案資料夾不開放以路徑存取，下載時由 Gradio 將檔案複製到它自己的暫存快取後提供
             if self.web_server:
-                demo.launch(inbrowser=True, server_name="0.0.0.0", auth=self.auth_user)
+                app, _, _ = demo.launch(inbrowser=True, server_name="0.0.0.0", auth=self.auth_user, allowed_paths=[image_store.cache_dir], prevent_thread_lock=True)
             else:
-                demo.launch(inbrowser=True, auth=self.auth_user)
+                app, _, _ = demo.launch(inbrowser=True, auth=self.auth_user, allowed_paths=[image_store.cache_dir], prevent_thread_lock=True)
+            app.add_api_route("/metrics", self.metrics, methods=["GET"], include_in_schema=False)
+            demo.block_thread()
             
 
 if __name__ == '__main__':